@@ -0,0 +1,186 @@
+"""Flight Control Unit"""
+
+import logging
+
+from typing import Any, Callable, NamedTuple
+
+from .hub import VariableHub
+
+logger = logging.getLogger(__name__)
+# logger.setLevel(logging.DEBUG)
+
+
+# ##############################
+# Toliss Airbus FCU
+FCU_MODE_DATAREFS = {  # datarefs displayed by each FCU representation mode
+    "horizontal": {
+        "sim/cockpit2/autopilot/airspeed_dial_kts_mach",
+        "sim/cockpit/autopilot/heading_mag",
+        "sim/cockpit/autopilot/airspeed_is_mach",
+        "sim/cockpit2/autopilot/altitude_dial_ft",
+        "sim/cockpit/autopilot/vertical_velocity",
+        "AirbusFBW/HDGTRKmode",
+        "AirbusFBW/SPDmanaged",
+        "AirbusFBW/HDGmanaged",
+        "AirbusFBW/ALTmanaged",
+        "AirbusFBW/SPDdashed",
+        "AirbusFBW/HDGdashed",
+        "AirbusFBW/VSdashed",
+    },
+    "vertical-left": {
+        "sim/cockpit2/autopilot/airspeed_dial_kts_mach",
+        "sim/cockpit/autopilot/heading_mag",
+        "sim/cockpit/autopilot/airspeed_is_mach",
+        "AirbusFBW/HDGTRKmode",
+        "AirbusFBW/SPDmanaged",
+        "AirbusFBW/HDGmanaged",
+        "AirbusFBW/SPDdashed",
+        "AirbusFBW/HDGdashed",
+        "AirbusFBW/BaroStdCapt",
+        "AirbusFBW/BaroUnitCapt",
+        "sim/cockpit2/gauges/actuators/barometer_setting_in_hg_pilot",
+    },
+    "vertical-right": {
+        "sim/cockpit2/autopilot/altitude_dial_ft",
+        "sim/cockpit/autopilot/vertical_velocity",
+        "AirbusFBW/HDGTRKmode",
+        "AirbusFBW/ALTmanaged",
+        "AirbusFBW/VSdashed",
+    },
+}
+FCU_DATAREFS = set().union(*FCU_MODE_DATAREFS.values())
+FCU_MODE_FIELDS = {  # FCUDisplay fields displayed by each FCU representation mode
+    "horizontal": {
+        "mach",
+        "heading_mode",
+        "speed",
+        "speed_managed",
+        "heading",
+        "heading_managed",
+        "altitude",
+        "altitude_managed",
+        "vertical_speed",
+        "vertical_speed_negative",
+    },
+    "vertical-left": {"mach", "heading_mode", "speed", "speed_managed", "heading", "heading_managed", "qnh"},
+    "vertical-right": {"heading_mode", "altitude", "altitude_managed", "vertical_speed", "vertical_speed_negative"},
+}
+
+
+class FCUDisplay(NamedTuple):
+    """What the FCU displays, values are formatted (and rounded) as displayed."""
+
+    mach: bool  # speed in mach
+    heading_mode: bool  # HDG-V/S mode, TRK-FPA mode if False
+    speed: str
+    speed_managed: bool
+    heading: str
+    heading_managed: bool
+    altitude: str
+    altitude_managed: bool
+    vertical_speed: str  # absolute value, sign in vertical_speed_negative
+    vertical_speed_negative: bool
+    qnh: str
+
+
+def fcu_display(get: Callable[[str, Any], Any]) -> FCUDisplay:
+    """Builds FCU display from datarefs values.
+    get(dataref, default) returns the value of dataref.
+    Defaults are demonstration values.
+    """
+    mach_mode = get("sim/cockpit/autopilot/airspeed_is_mach", 0) == 1
+    heading_mode = get("AirbusFBW/HDGTRKmode", 1) == 0
+
+    # SPEED
+    speed = "---"
+    if get("AirbusFBW/SPDdashed", 0) != 1:
+        spdft = 0.56 if mach_mode else 249
+        speed_val = get("sim/cockpit2/autopilot/airspeed_dial_kts_mach", spdft)
+        if speed_val is not None:
+            if mach_mode:
+                speed_val = round(speed_val * 100) / 100
+                speed = f"{speed_val:4.2f}"
+            else:
+                speed_val = int(round(speed_val, 0))
+                speed = f"{speed_val:3d}"
+
+    # HEADING
+    heading = "---"
+    if get("AirbusFBW/HDGdashed", 0) != 1:
+        heading_val = get("sim/cockpit/autopilot/heading_mag", 0)
+        heading_val = int(round(heading_val, 0))
+        heading = f"{heading_val:03d}"
+
+    # ALTITUDE (always displayed)
+    alt_managed = get("AirbusFBW/ALTmanaged", 0) == 1
+    alt_ft_val = get("sim/cockpit2/autopilot/altitude_dial_ft", 26789)
+    alt_ft_val = int(round(alt_ft_val, 0))
+    alt = f"{alt_ft_val: 5d}"  # should always be len=5
+
+    # Vertical speed/slope is tricky
+    vs_val = -1
+    if alt_managed or get("AirbusFBW/VSdashed", False):
+        vs = "----" if heading_mode else "-.---"
+    else:
+        vsdft = -1200 if heading_mode else -2.5
+        vs_val = get("sim/cockpit/autopilot/vertical_velocity", vsdft)
+        if heading_mode:  # V/S
+            vs_val_abs = abs(int(round(vs_val / 100, 0)))
+            vs = f"{vs_val_abs:02d}" + "oo"  # little zeros
+        else:  # FPA
+            vs_val_abs = abs(round(vs_val * 10) / 10)
+            vs = f"{vs_val_abs:3.1f}"
+
+    # QNH
+    qnh = "Std"
+    if get("AirbusFBW/BaroStdCapt", 0) != 1:
+        qnh_val = get("sim/cockpit2/gauges/actuators/barometer_setting_in_hg_pilot", 0)
+        if get("AirbusFBW/BaroUnitCapt", 1) == 1:  # metric
+            qnh_val = int(round(float(qnh_val) * 33.8639, 0))
+            qnh = f"{qnh_val:04d}"
+        else:
+            qnh_val = round(float(qnh_val), 2)
+            qnh = f"{qnh_val:5.2f}"
+
+    return FCUDisplay(
+        mach=mach_mode,
+        heading_mode=heading_mode,
+        speed=speed,
+        speed_managed=get("AirbusFBW/SPDmanaged", 0) == 1,
+        heading=heading,
+        heading_managed=get("AirbusFBW/HDGmanaged", 0) == 1,
+        altitude=alt,
+        altitude_managed=alt_managed,
+        vertical_speed=vs,
+        vertical_speed_negative=vs_val < 0,
+        qnh=qnh,
+    )
+
+
+class FCU(VariableHub):
+    """Derives what the FCU displays from FCU datarefs, representations are notified with the display fields that changed."""
+
+    CALLBACK = "fcu_changed"  # fcu_changed(display, fields)
+
+    def __init__(self) -> None:
+        VariableHub.__init__(self, name="FCU")
+        self._display = fcu_display(self.get_value)
+
+    def get_variables(self) -> set:
+        return FCU_DATAREFS
+
+    @property
+    def display(self) -> FCUDisplay:
+        """Latest FCU display, with pending changes."""
+        self.update()
+        return self._display
+
+    def decode(self) -> dict | None:
+        previous = self._display
+        display = fcu_display(self.get_value)
+        if display == previous:
+            return None
+        self._display = display
+        fields = set([f for f in FCUDisplay._fields if getattr(display, f) != getattr(previous, f)])
+        logger.debug(f"FCU fields changed: {fields}")
+        return {"display": display, "fields": fields}
@@ -0,0 +1,615 @@
+"""Flight Mode Annunciators"""
+
+import atexit
+import logging
+import re
+import time
+
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, NamedTuple, Tuple
+
+from .hub import VariableHub
+
+logger = logging.getLogger(__name__)
+# logger.setLevel(logging.DEBUG)
+
+
+# ##############################
+# Toliss Airbus FMA display
+FMA_DATAREFS = {
+    "1w": "AirbusFBW/FMA1w",
+    "1g": "AirbusFBW/FMA1g",
+    "1b": "AirbusFBW/FMA1b",
+    "2w": "AirbusFBW/FMA2w",
+    "2b": "AirbusFBW/FMA2b",
+    "2m": "AirbusFBW/FMA2m",
+    "3w": "AirbusFBW/FMA3w",
+    "3b": "AirbusFBW/FMA3b",
+    "3a": "AirbusFBW/FMA3a",
+}
+FMA_BOXES = [
+    "AirbusFBW/FMAAPFDboxing",
+    "AirbusFBW/FMAAPLeftArmedBox",
+    "AirbusFBW/FMAAPLeftModeBox",
+    "AirbusFBW/FMAAPRightArmedBox",
+    "AirbusFBW/FMAAPRightModeBox",
+    "AirbusFBW/FMAATHRModeBox",
+    "AirbusFBW/FMAATHRboxing",
+    "AirbusFBW/FMATHRWarning",
+]
+
+FMA_LINES = len(set([c[0] for c in FMA_DATAREFS]))
+# FMA_COLUMNS = [[0, 7], [7, 15], [15, 21], [21, 28], [28, 37]]
+FMA_COLUMNS = [[0, 7], [7, 15], [15, 21], [21, 30], [30, 37]]
+FMA_LINE_LENGTH = FMA_COLUMNS[-1][-1]
+FMA_EMPTY_LINE = " " * FMA_LINE_LENGTH
+FMA_MESSAGE_LINES = ["3a", "3w"]  # 3rd line texts displayed across columns 2-3
+COMBINED = "combined"
+WARNING = "warn"
+FMA_GRID_COLORS = [None] + sorted(set([c[1] for c in FMA_DATAREFS]))  # color index 0 means no character
+
+
+# More or less ok for A320 series
+FMA_MESSAGES = [
+    "1TOGA",  # FMA 1 (THR)
+    "1FLX ([0-9]+) MCT",
+    "CLB",
+    "1IDLE ASYM",
+    "1A. FLOOR",
+    "1TOGA LK",
+    "1THR LK",
+    "1MAN TOGA",
+    "1MAN FLEX",
+    "1MAN MCT",
+    "1THR MCT",
+    "1THR CLB",
+    "1THR LVR",
+    "1THR SPEED",
+    "1THR IDLE",
+    "1THR DES",  # A339
+    "1SPEED",
+    "1MACH",
+    "1LVR CLB",
+    "1LVR MCT",
+    "1LVR ASYM",
+    "2SRS",  # FMA 2 (VNAV)
+    "2BRK LO",
+    "2BRK MED",
+    "2ALT",
+    "2ALT*",
+    "2ALT CRZ",
+    "2ALT CST",
+    "2V/S",
+    "2CLB",
+    "2DES",
+    "2OP CLB",
+    "2EXP CLB",
+    "2EXP DES",
+    "2OP DES",
+    "2G/S",
+    "2FINAL",
+    "2V/S ± ([0-9]+)",
+    "2FPA ± ([0-9]+).([0-9]+)",
+    "3RWY",  # FMA 3 (LNAV)
+    "3RWY TRK",
+    "3GA TRK",
+    "3TRACK",
+    "3HDG",
+    "3NAV",
+    "3LOC",
+    "3LOC*",
+    "3APP NAV",
+    "4CAT 1",  # FMA 4 (APPCH)
+    "4CAT 2",
+    "4CAT 3",
+    "4SINGLE",
+    "4CAT 3",
+    "4DUAL",
+    "4DH ([0-9]+)",
+    "4MDA ([0-9]+)",
+    "5AP 1",  # FMA 5 (MODE)
+    "5AP 2",
+    "5AP 1+2",
+    "5AP1",  # same, no space
+    "5AP2",
+    "5AP1+2",
+    "5-FD-",  # completely off
+    "51FD2",
+    "51FD",
+    "5FD2",
+    "51FD1",
+    "52FD2",
+    "52FD",
+    "5FD1",
+    "5A/THR",
+    "CLAND",  # COMBINED MODES
+    "CFLARE",
+    "CROLL",
+    "COUT",
+    "CFINAL",
+    "CAPP",
+    "MUSE MAN PITCH TRIM",  # FMA MESSAGES
+    "MMAN PITCH TRIM ONLY",
+    "MDECELERATE",
+    "MMORE DRAG",
+    "MVERTICAL DISCON AHEAD",
+    "MCHECK APP SEL",
+    "MSET GREEN DOT SPD",
+    "MSET HOLD SPEED",
+    "MMACH SEL .([0-9]+)",
+    "MSPEED SEL ([0-9]+)",
+]
+
+GLOBAL_SUBSTITUTES = {"THRIDLE": "THR IDLE", "FNL": "FINAL", "1FD": "1 FD", "FD2": "FD 2"}
+
+# Aircraft specific FMA rules, by aircraft ICAO code.
+#   datarefs: additional datarefs necessary to evaluate the rules,
+#   rules: applied in order to FMA texts each time the FMA is decoded.
+#     when: conditions, all must be met:
+#       same: [dataref, dataref], both datarefs have the same value,
+#       equals: {dataref: value, ...}, datarefs have the values.
+#     lines: FMA texts (line/color code) the rule applies to,
+#     text: (optional) rule only applies if the stripped text is this one,
+#     replace: [old, new], replaces old by new in text,
+#     set: replaces the whole text.
+FMA_AIRCRAFT_RULES = {
+    "A339": {
+        "datarefs": [
+            #    "AirbusFBW/AltitudeTargetIsFL",
+            "toliss_airbus/init/cruise_alt",
+            "toliss_airbus/pfdoutputs/general/ap_altitude_reference",
+            "AirbusFBW/AutoBrkLo",
+            "AirbusFBW/AutoBrkMed",
+        ],
+        "rules": [
+            {
+                "when": {"same": ["toliss_airbus/init/cruise_alt", "toliss_airbus/pfdoutputs/general/ap_altitude_reference"]},
+                "lines": ["1w", "2b"],
+                "text": "ALT",
+                "replace": ["ALT    ", "ALT CRZ"],
+            },
+            {"when": {"equals": {"AirbusFBW/AutoBrkMed": 1}}, "lines": ["2b"], "set": "BRK MED"},
+            {"when": {"equals": {"AirbusFBW/AutoBrkLo": 1}}, "lines": ["2b"], "set": "BRK LO"},  # LO has precedence over MED
+        ],
+    },
+}
+
+FMA_MATCHER_CACHE_SIZE = 256  # (message, column) verdicts kept
+FMA_UNKNOWN_CAPACITY = 200  # (column, message) unknown annunciations kept
+FMA_UNKNOWN_LOG_INTERVAL = 10.0  # seconds, minimum delay between two logged unknown annunciations
+FMA_OVERLAPS_LOGGED = 50  # distinct grid overlaps logged as warnings, others are logged at debug level
+
+
+class FMAMessageMatcher:
+    """Validates FMA annunciations against a list of known messages.
+
+    Messages are prefixed by their column: 1-5 for annunciators, C for combined modes, M for messages.
+    Message lists are indexed once, at creation, and recent verdicts are memoized,
+    so that validating the same annunciation on every frame costs a dictionary lookup.
+    """
+
+    def __init__(self, messages: List[str], substitutes: Dict[str, str], cache_size: int = FMA_MATCHER_CACHE_SIZE) -> None:
+        self.substitutes = substitutes
+        self.exact: Dict[str, set] = {}  # column prefix: {messages}
+        self.nospace: Dict[str, set] = {}  # column prefix: {messages without spaces}
+        self.anywhere = set()  # messages, whatever their column
+        patterns = []
+        for m in messages:
+            prefix, body = m[0], m[1:]
+            self.exact.setdefault(prefix, set()).add(body)
+            self.nospace.setdefault(prefix, set()).add(body.replace(" ", ""))
+            self.anywhere.add(body)
+            if "(" in m:
+                patterns.append(m)
+        # One alternation for all parametrized messages, with and without column prefix
+        self.patterns = re.compile("|".join([f"(?:{p})" for p in patterns])) if len(patterns) > 0 else None
+        self.patterns_anywhere = re.compile("|".join([f"(?:{p[1:]})" for p in patterns])) if len(patterns) > 0 else None
+        self._match = lru_cache(maxsize=cache_size)(self._match_uncached)
+
+    @staticmethod
+    def column_prefix(column: int) -> str:
+        if 1 <= column <= 5:  # annunciators 1-5
+            return str(column)
+        elif column == 6:  # combined
+            return "C"
+        elif column == 7:  # messages
+            return "M"
+        return ""
+
+    def _match_uncached(self, message: str, column: int) -> Tuple[str, bool]:
+        text = message
+        for k, v in self.substitutes.items():
+            text = text.replace(k, v)
+        message = text.strip()  # match what is displayed, FNL is known as FINAL
+        prefix = self.column_prefix(column)
+        if message in self.exact.get(prefix, set()):
+            logger.debug(f"found {prefix}{message}")
+            return text, True
+        # search making abstraction of spaces, sometimes AP1 is "AP 1".
+        if message.replace(" ", "") in self.nospace.get(prefix, set()):
+            logger.debug(f"found {prefix}{message} (no space)")
+            return text, True
+        # search without column
+        if message in self.anywhere:
+            logger.debug(f"found {message} ({column})")
+            return text, True
+        if self.patterns is not None:
+            if self.patterns.match(prefix + message) is not None or self.patterns_anywhere.match(message) is not None:
+                logger.debug(f"{message} ({column}) matches a parametrized message")
+                return text, True
+        logger.debug(f"{message} ({column}) not in FMA message list")
+        return text, False
+
+    def match(self, message: str, column: int = 0) -> Tuple[str, bool]:
+        """Returns the text to display for message, with global substitutes applied,
+        and whether it is a known message for that column.
+        Display text is returned unstripped, as received.
+        """
+        return self._match(message, column)
+
+    def is_fma_message(self, message: str, column: int = 0) -> bool:
+        return self._match(message, column)[1]
+
+    def cache_info(self):
+        return self._match.cache_info()
+
+
+FMA_MATCHER = FMAMessageMatcher(messages=FMA_MESSAGES, substitutes=GLOBAL_SUBSTITUTES)
+
+
+class FMAUnknownMessages:
+    """Collects annunciations that are not in FMA_MESSAGES, with the number of decoded FMA they appeared in.
+
+    Each new annunciation is logged once, at most one every interval seconds.
+    At most capacity annunciations are kept, others are only counted as dropped.
+    Use table() or dump() to get the collection, for example to extend FMA_MESSAGES.
+    The collection is dumped in the log when FMA representations are described and at exit.
+    """
+
+    def __init__(self, capacity: int = FMA_UNKNOWN_CAPACITY, interval: float = FMA_UNKNOWN_LOG_INTERVAL) -> None:
+        self.capacity = capacity
+        self.interval = interval
+        self.counts: OrderedDict = OrderedDict()  # (column, message): count
+        self.dropped = 0
+        self._last_logged = 0.0
+        self._not_logged = 0
+
+    def add(self, column: int, message: str):
+        key = (column, message.strip())
+        count = self.counts.get(key)
+        if count is not None:
+            self.counts[key] = count + 1
+            return
+        if len(self.counts) >= self.capacity:
+            self.dropped = self.dropped + 1
+            return
+        self.counts[key] = 1
+        now = time.monotonic()
+        if now - self._last_logged < self.interval:
+            self._not_logged = self._not_logged + 1
+            return
+        more = f" ({self._not_logged} more not logged)" if self._not_logged > 0 else ""
+        logger.warning(f"FMA {column}: unknown message '{key[1]}'{more}")
+        self._last_logged = now
+        self._not_logged = 0
+
+    def table(self) -> List[Tuple[int, str, int]]:
+        """Returns (column, message, count), most frequent first."""
+        return sorted([(c, m, n) for (c, m), n in self.counts.items()], key=lambda t: t[2], reverse=True)
+
+    def dump(self):
+        for column, message, count in self.table():
+            logger.info(f"FMA {column}: '{message}' in {count} FMA updates")
+        if self.dropped > 0:
+            logger.info(f"FMA: {self.dropped} unknown messages not collected")
+
+    def clear(self):
+        self.counts.clear()
+        self.dropped = 0
+        self._not_logged = 0
+
+
+FMA_UNKNOWN = FMAUnknownMessages()
+atexit.register(FMA_UNKNOWN.dump)
+
+
+class FMAGrid:
+    """FMA characters and colors, FMA_LINES lines of FMA_LINE_LENGTH cells.
+
+    Characters (as code points) and colors (as index in FMA_GRID_COLORS) are kept
+    in two flat array planes, one line after the other.
+    Color layers are merged by runs of non blank characters, using slice operations on planes.
+    When several layers have a character in the same cell, the first layer wins,
+    and the cell is reported in overlaps as (line, column, character, color).
+    Each distinct overlap is only logged once.
+    """
+
+    BLANK_CHARS = array("I", (" " * (FMA_LINES * FMA_LINE_LENGTH)).encode("utf-32-le"))
+    BLANK_COLORS = array("B", bytes(FMA_LINES * FMA_LINE_LENGTH))
+    NOT_BLANK = re.compile("[^ ]+")
+    _logged: set = set()  # overlaps already logged
+
+    def __init__(self, chars: array, colors: array, overlaps: tuple = ()) -> None:
+        self.chars = chars
+        self.colors = colors
+        self.overlaps = overlaps
+
+    @classmethod
+    def from_texts(cls, texts: Mapping[str, str]) -> "FMAGrid":
+        """Merges FMA texts, keyed by line/color code like "1w", into a grid."""
+        chars = array("I", cls.BLANK_CHARS)
+        colors = array("B", cls.BLANK_COLORS)
+        overlaps = []
+        for code, text in texts.items():
+            color = FMA_GRID_COLORS.index(code[1])
+            base = (int(code[0]) - 1) * FMA_LINE_LENGTH
+            for run in cls.NOT_BLANK.finditer(text[:FMA_LINE_LENGTH]):
+                s = base + run.start()
+                e = base + run.end()
+                if not any(colors[s:e]):
+                    chars[s:e] = array("I", run.group().encode("utf-32-le"))
+                    colors[s:e] = array("B", [color]) * (e - s)
+                    continue
+                for i, c in enumerate(run.group(), start=s):  # overlap, cell by cell
+                    if colors[i] != 0:
+                        overlaps.append((int(code[0]), i - base, c, code[1]))
+                        continue
+                    chars[i] = ord(c)
+                    colors[i] = color
+        if len(overlaps) > 0:
+            key = tuple(overlaps)
+            if key not in cls._logged and len(cls._logged) < FMA_OVERLAPS_LOGGED:
+                cls._logged.add(key)
+                logger.warning(f"FMA: {len(overlaps)} characters overlap: {overlaps}")
+            else:
+                logger.debug(f"FMA: {len(overlaps)} characters overlap: {overlaps}")
+        return cls(chars=chars, colors=colors, overlaps=tuple(overlaps))
+
+    def line(self, line: int) -> str:
+        """Text of line, lines are numbered 1 to FMA_LINES."""
+        s = (line - 1) * FMA_LINE_LENGTH
+        return self.chars[s : s + FMA_LINE_LENGTH].tobytes().decode("utf-32-le")
+
+    def cell(self, line: int, column: int) -> Tuple[str, str | None]:
+        """Character and color code of cell, lines are numbered 1 to FMA_LINES, columns from 0."""
+        i = (line - 1) * FMA_LINE_LENGTH + column
+        return chr(self.chars[i]), FMA_GRID_COLORS[self.colors[i]]
+
+    def as_lines(self) -> list:
+        """Returns array of lines, each line is array of tuple (character, color).
+        [[("a", "g"), ("b", "w"), ...], [...]]
+        """
+        colors = [FMA_GRID_COLORS[c] for c in self.colors]
+        all_lines = []
+        for li in range(FMA_LINES):
+            s = li * FMA_LINE_LENGTH
+            all_lines.append(list(zip(self.line(li + 1), colors[s : s + FMA_LINE_LENGTH])))
+        return all_lines
+
+
+class FMARules:
+    """Aircraft specific rules from FMA_AIRCRAFT_RULES, compiled into functions."""
+
+    def __init__(self, icao: str) -> None:
+        self.icao = icao
+        definition = FMA_AIRCRAFT_RULES.get(icao, {})
+        self.datarefs = set(definition.get("datarefs", []))
+        self.rules = [self.compile(rule) for rule in definition.get("rules", [])]
+        logger.debug(f"{len(self.rules)} FMA rules for {icao}")
+
+    @staticmethod
+    def compile_condition(when: dict) -> Callable[[dict], bool]:
+        conditions = []
+        same = when.get("same")
+        if same is not None:
+            a, b = same
+            conditions.append(lambda values: a in values and b in values and values[a] == values[b])
+        equals = when.get("equals")
+        if equals is not None:
+            expected = list(equals.items())
+            conditions.append(lambda values: all([values.get(d) == v for d, v in expected]))
+        return lambda values: all([c(values) for c in conditions])
+
+    @staticmethod
+    def compile(rule: dict) -> Callable[[dict, dict], None]:
+        condition = FMARules.compile_condition(rule.get("when", {}))
+        lines = rule.get("lines", [])
+        only = rule.get("text")
+        replace = rule.get("replace")
+        newtext = rule.get("set")
+
+        def apply(values: dict, texts: dict):
+            if not condition(values):
+                return
+            for line in lines:
+                text = texts.get(line, FMA_EMPTY_LINE)
+                if only is not None and text.strip() != only:
+                    continue
+                before = text
+                if replace is not None:
+                    text = text.replace(replace[0], replace[1])
+                if newtext is not None:
+                    text = newtext.ljust(FMA_LINE_LENGTH)
+                texts[line] = text
+                logger.debug(f"fma text modified: {line}: {before} -> {text}")
+
+        return apply
+
+    def apply(self, values: dict, texts: dict):
+        """Applies rules to texts, in place. Values are datarefs values."""
+        for rule in self.rules:
+            rule(values, texts)
+
+
+@lru_cache
+def get_fma_rules(icao: str) -> FMARules:
+    return FMARules(icao=icao)
+
+
+def get_fma_variables(icao: str) -> set:
+    """Datarefs necessary to display the FMA of aircraft icao."""
+    return set(FMA_BOXES) | set(FMA_DATAREFS.values()) | get_fma_rules(icao).datarefs
+
+
+class FMASnapshot(NamedTuple):
+    """Decoded FMA, never modified once published.
+
+    columns contains, for each annunciator, the set of its non empty texts,
+    each text prefixed by its line number and color code, like "1gSPEED".
+    When vertical and lateral modes are combined, column 2 spans columns 2 and 3, and column 3 is empty.
+    """
+
+    serial: int
+    texts: Mapping[str, str]  # line/color code: 37 characters
+    boxed: frozenset
+    columns: Tuple[frozenset, ...]
+
+    @property
+    def combined(self) -> bool:
+        return COMBINED in self.boxed
+
+    def column_state(self, idx: int) -> tuple:
+        """What is displayed in column idx: texts, boxes, and box color if boxed."""
+        boxes = frozenset([b for b in self.boxed if b[0] == str(idx + 1)])
+        return (self.columns[idx], boxes, len(boxes) > 0 and WARNING in self.boxed, idx in [1, 2] and self.combined)
+
+
+class FMA(VariableHub):
+    """Decodes FMA datarefs into a FMASnapshot, representations are notified with the columns that changed.
+    Aircraft specific rules follow the aircraft loaded in the simulator, see set_icao().
+    """
+
+    CALLBACK = "fma_changed"  # fma_changed(snapshot, columns)
+
+    def __init__(self, icao: str = "") -> None:
+        VariableHub.__init__(self, name="FMA")
+        self.icao = icao
+        self.rules = get_fma_rules(icao)
+        self._snapshot = FMASnapshot(
+            serial=0,
+            texts=MappingProxyType({k: FMA_EMPTY_LINE for k in FMA_DATAREFS}),
+            boxed=frozenset(),
+            columns=tuple(frozenset() for c in FMA_COLUMNS),
+        )
+
+    def get_variables(self) -> set:
+        return get_fma_variables(self.icao)
+
+    def set_icao(self, icao: str):
+        """Applies the rules of aircraft icao from now on, requests the additional datarefs they need."""
+        if icao == self.icao:
+            return
+        with self._lock:
+            self.icao = icao
+            self.rules = get_fma_rules(icao)
+            self.subscribe(self.get_variables())
+            self._dirty = True
+        logger.info(f"FMA rules for {icao}, {len(self.variables)} variables")
+        self.update()
+
+    @property
+    def snapshot(self) -> FMASnapshot:
+        """Latest decoded FMA. Pending changes are decoded first, a button may read it before the FMA is notified."""
+        self.update()
+        return self._snapshot
+
+    def decode(self) -> dict | None:
+        previous = self._snapshot
+        texts = {}
+        for code, dataref in FMA_DATAREFS.items():
+            text = self.datarefs.get(dataref)
+            if type(text) is not str:  # not received yet, or not received as a string
+                text = FMA_EMPTY_LINE
+            texts[code] = text.ljust(FMA_LINE_LENGTH)[:FMA_LINE_LENGTH]
+        self.rules.apply(self.datarefs, texts)
+        boxed = self.check_boxed()
+
+        if texts == previous.texts and boxed == previous.boxed:
+            return None
+
+        combined = COMBINED in boxed
+        snapshot = self._snapshot = FMASnapshot(
+            serial=previous.serial + 1,
+            texts=MappingProxyType(texts),
+            boxed=boxed,
+            columns=tuple(self.get_fma_lines(texts, idx, combined) for idx in range(len(FMA_COLUMNS))),
+        )
+        columns = set([idx for idx in range(len(FMA_COLUMNS)) if snapshot.column_state(idx) != previous.column_state(idx)])
+        logger.debug(f"FMA columns changed: {columns}")
+        self.collect_unknown(snapshot)
+        return {"snapshot": snapshot, "columns": columns}
+
+    def collect_unknown(self, snapshot: FMASnapshot):
+        """Counts unknown annunciations once per snapshot they appear in.
+        Third line texts of columns 2-3 are messages, checked as combined modes (6) or messages (7).
+        """
+        s = FMA_COLUMNS[1][0]
+        e = FMA_COLUMNS[2][1]
+        messages = set()
+        for idx, texts in enumerate(snapshot.columns):
+            for text in texts:
+                if idx in [1, 2] and text[:2] in FMA_MESSAGE_LINES:
+                    messages.add((6 if idx == 1 else 7, snapshot.texts[text[:2]][s:e].strip()))
+                elif not FMA_MATCHER.is_fma_message(text[2:], idx + 1):
+                    FMA_UNKNOWN.add(column=idx + 1, message=text[2:])
+        for column, message in messages:
+            if not FMA_MATCHER.is_fma_message(message, column):
+                FMA_UNKNOWN.add(column=column, message=message)
+
+    def get_fma_lines(self, texts: dict, idx: int, combined: bool) -> frozenset:
+        s = FMA_COLUMNS[idx][0]
+        e = FMA_COLUMNS[idx][1]
+        if combined and idx == 1:
+            e = FMA_COLUMNS[idx + 1][1]
+        elif combined and idx == 2:
+            return frozenset()
+        empty = " " * (e - s)
+        lines = []
+        for code, text in texts.items():
+            m = text[s:e]
+            if m != empty:
+                lines.append(code + m)
+        return frozenset(lines)
+
+    def check_boxed(self) -> frozenset:
+        """Check "boxed" datarefs to determine which texts are boxed/framed.
+        They are listed as FMA#-LINE# pairs of digit. Special keyword WARNING if warning enabled.
+        """
+        boxed = []
+        if self.get_value("AirbusFBW/FMAAPLeftArmedBox") == 1:
+            boxed.append("22")
+        if self.get_value("AirbusFBW/FMAAPLeftModeBox") == 1:
+            boxed.append("21")
+        if self.get_value("AirbusFBW/FMAAPRightArmedBox") == 1:
+            boxed.append("32")
+        if self.get_value("AirbusFBW/FMAAPRightModeBox") == 1:
+            boxed.append("31")
+        if self.get_value("AirbusFBW/FMAATHRModeBox") == 1:
+            boxed.append("11")
+        if self.get_value("AirbusFBW/FMAATHRboxing") == 1:
+            boxed.append("12")
+        if self.get_value("AirbusFBW/FMAATHRboxing") == 2:
+            boxed.append("11")
+            boxed.append("12")
+        if self.get_value("AirbusFBW/FMATHRWarning") == 1:
+            boxed.append(WARNING)
+        # big mess:
+        boxcode = self.get_value("AirbusFBW/FMAAPFDboxing")
+        if boxcode is not None:  # can be 0-7, is it a set of binary flags?
+            boxcode = int(boxcode)
+            if boxcode & 1 == 1:
+                boxed.append("51")
+            if boxcode & 2 == 2:
+                boxed.append("52")
+            if boxcode & 4 == 4:
+                boxed.append("53")
+            if boxcode & 8 == 8:
+                boxed.append(COMBINED)
+            if boxcode & 9 == 9:
+                boxed.append("21")
+            # etc.
+        logger.debug(f"boxed: {boxcode}, {boxed}")
+        return frozenset(boxed)
@@ -0,0 +1,114 @@
+"""Dataref collectors shared by all representations of a simulator"""
+
+import logging
+import threading
+import weakref
+
+from typing import Dict
+
+from cockpitdecks.variable import VariableListener
+
+logger = logging.getLogger(__name__)
+# logger.setLevel(logging.DEBUG)
+
+
+class VariableHub(VariableListener):
+    """Collects dataref values for all representations of a simulator and decodes them.
+
+    There is one hub per simulator for each subclass, see get_hub().
+    Each time a value changes, values are decoded again and registered representations
+    are notified of what changed through their method named CALLBACK.
+    Subclasses list their datarefs in get_variables() and decode values in decode().
+    """
+
+    CALLBACK = ""
+    _shared: Dict[int, "VariableHub"] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._shared = {}  # one hub per simulator and subclass
+
+    def __init__(self, name: str) -> None:
+        VariableListener.__init__(self, name=name)
+        self.simulator = None
+        self.variables: set = set()
+        self.datarefs = {}
+        self._listeners = weakref.WeakSet()
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_hub(cls, simulator, **kwargs) -> "VariableHub":
+        """Returns the hub of simulator, creates it with kwargs if necessary.
+        A hub left by a previous simulator is closed.
+        """
+        hub = cls._shared.get(id(simulator))
+        if hub is None or hub.simulator is not simulator:
+            if hub is not None:
+                hub.close()
+            hub = cls(**kwargs)
+            hub.init(simulator=simulator)
+            cls._shared[id(simulator)] = hub
+        return hub
+
+    def init(self, simulator):
+        self.simulator = simulator
+        self.subscribe(self.get_variables())
+        logger.info(f"{self.name} requests {len(self.variables)} variables")
+
+    def subscribe(self, variables: set):
+        """Listens to variables not listened to yet."""
+        for varname in variables - self.variables:
+            var = self.simulator.get_variable(name=varname)
+            var.add_listener(self)
+            if var.value is not None:
+                self.datarefs[varname] = var.value
+        self.variables = self.variables | variables
+
+    def close(self):
+        """Stops listening to variables and forgets registered representations."""
+        for varname in self.variables:
+            self.simulator.get_variable(name=varname).remove_listener(self)
+        self.variables = set()
+        self._listeners.clear()
+        logger.debug(f"{self.name} closed")
+
+    def get_variables(self) -> set:
+        return set()
+
+    def register(self, listener):
+        self._listeners.add(listener)
+
+    def get_value(self, dataref: str, default=None):
+        value = self.datarefs.get(dataref)
+        return default if value is None else value
+
+    def variable_changed(self, variable):
+        if variable.name not in self.variables:
+            logger.debug(f"not a {self.name} dataref {variable.name}")
+            return
+        if self.datarefs.get(variable.name) == variable.value:
+            return
+        self.datarefs[variable.name] = variable.value
+        self._dirty = True
+        self.update()
+
+    def update(self):
+        """Decodes values if one changed since last decode, then notifies listeners if something changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            changes = self.decode()
+        if changes is not None:
+            self.notify(**changes)
+
+    def notify(self, **changes):
+        for listener in list(self._listeners):
+            getattr(listener, self.CALLBACK)(**changes)
+
+    def decode(self) -> dict | None:
+        """Decodes values and publishes the result, called with lock held.
+        Returns the arguments of the listeners callback, None if nothing changed.
+        """
+        return None
@@ -1,9 +1,20 @@
 """MCDU"""
 
 import logging
+import queue
 import re
+import struct
+import threading
+import time
 
-from cockpitdecks.variable import VariableListener
+from collections import deque
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Tuple
+
+from PIL import Image, ImageDraw
+
+from .hub import VariableHub
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -22,44 +33,291 @@ MCDU_COLORS = {
     "Lg": "#00FF00",  # bold white, bright green
 }
 SLEW_KEYS = "VertSlewKeys"
+MCDU_SPECIAL_CHARACTERS = {  # "special" characters (rev. eng.), code: (character, color, in alternate font)
+    "0": ("←", "b", False),
+    "1": ("↑", "w", False),
+    "2": ("←", "w", False),
+    "3": ("→", "w", False),
+    "4": ("↓", "w", False),
+    "A": ("[", "b", True),
+    "B": ("]", "b", True),
+    "E": ("☐", "a", True),  # amber box, drawn as a rectangle
+}
+MCDU_BOX = "☐"
+
+# Character grid frames, little endian
+# full frame: header, then MCDU_ROWS x 24 cells
+# delta frame: header, then changed cells with their position
+MCDU_FRAME_FULL = ord("F")
+MCDU_FRAME_DELTA = ord("D")
+MCDU_FRAME_FULL_HEADER = struct.Struct("<BBIBB")  # kind, unit, sequence, rows, columns
+MCDU_FRAME_DELTA_HEADER = struct.Struct("<BBIIH")  # kind, unit, sequence, since sequence, number of cells
+MCDU_FRAME_CELL = struct.Struct("<IBB")  # character code point (any Unicode code point), color index, size (0 = large, 1 = small)
+MCDU_FRAME_DELTA_CELL = struct.Struct("<BBIBB")  # row, column, character code point, color index, size
+MCDU_FRAME_COLORS = "abgmswy"  # color index in frame cells
+MCDU_FRAME_HISTORY = 32  # grids kept to build delta frames
+MCDU_COALESCE_WINDOW = 0.05  # seconds, changes arriving within this delay are applied together
+
+MCDU_BLANK_ROW = tuple([(" ", "w", 0)] * 24)
 
 MCDU_UNIT = "mucdu-unit"
 
+MCDU_ROWS = 14  # title, 6 pairs of label and content, scratchpad
 MCDU_DISPLAY_DATA = r"AirbusFBW/MCDU(?P<unit>[1-3])(?P<name>(title|stitle|sp|label|cont|scont))(?P<line>[1-6]?)(?P<color>(Lw|Lg|[abgmswy]))"
 
 
-class MCDU(VariableListener):
+class MCDURoute(NamedTuple):
+    """Where the value of a MCDU dataref goes, prepared once for each requested dataref."""
+
+    unit: int
+    what: str  # title, stitle, sp, label, cont, scont, or SLEW_KEYS
+    line: int  # 1-6, -1 for title, scratchpad and slew keys
+    color: str
+    small: bool  # small characters
+    key: str  # line in MCDU.lines
+    colors: tuple  # colors of the line
+
+
+class MCDULayer(NamedTuple):
+    """One color of a line, lines are merged from their layers."""
+
+    dataref: str
+    color: str  # color displayed, Lg, Lw displayed as g, w
+    size: int  # 0 = large, 1 = small
+
+
+def get_route(dataref: str) -> MCDURoute | None:
+    m = re.match(f"{MCDU_ROOT}(?P<unit>[1-3]){SLEW_KEYS}", dataref)
+    if m is not None:
+        return MCDURoute(unit=int(m["unit"]), what=SLEW_KEYS, line=-1, color="", small=False, key="", colors=())
+    m = re.match(MCDU_DISPLAY_DATA, dataref)
+    if m is None:
+        return None
+    what = m["name"]
+    line = -1
+    if what.endswith("title"):  # stitle, title
+        colors = tuple("bgwys")
+    elif what == "sp":
+        colors = tuple("aw")
+    else:  # label, scont, cont
+        colors = tuple(MCDU_COLORS.keys()) if what == "label" else tuple([c for c in MCDU_COLORS.keys() if not c.startswith("L")])
+        line = int(m["line"])
+    line_str = "" if line == -1 else str(line)
+    return MCDURoute(
+        unit=int(m["unit"]),
+        what=what,
+        line=line,
+        color=m["color"],
+        small=what in ["stitle", "scont", "label"] and not m["color"].startswith("L"),
+        key=f"{MCDU_ROOT}{m['unit']}{what}{line_str}",
+        colors=colors,
+    )
+
+
+def display_character(char: str, color: str) -> Tuple[str, str, bool]:
+    """Returns the character and color displayed for a MCDU cell, and whether it uses the alternate font."""
+    alternate = False
+    if color == "s":
+        char, color, alternate = MCDU_SPECIAL_CHARACTERS.get(char, (char, "s", False))
+    if char == "`":  # does not print on terminal
+        char = "°"
+    return char, color, alternate
+
+
+class MCDUGlyphAtlas:
+    """Pre-rasterised MCDU character cells, one cell per (character, color, size).
+    Fonts are [small, large, small alternate, large alternate], alternate fonts have the special characters.
+    A cell is char_delta wide, centered on the character, cells are pasted next to each other.
+    """
+
+    def __init__(self, fonts: list, char_delta: int):
+        self.fonts = fonts
+        self.char_delta = char_delta
+        self.metrics = [font.getmetrics() for font in fonts]
+        self.cells: Dict[tuple, Tuple[Image.Image, int]] = {}  # (char, color, size): (bitmap, ascent)
+
+    def cell(self, char: str, color: str, size: int) -> Tuple[Image.Image, int]:
+        key = (char, color, size)
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.make_cell(char=char, color=color, size=size)
+            self.cells[key] = cell
+        return cell
+
+    def make_cell(self, char: str, color: str, size: int) -> Tuple[Image.Image, int]:
+        idx = 0 if size > 0 else 1
+        char, color, alternate = display_character(char, color)
+        if alternate:
+            idx = idx + 2
+        font = self.fonts[idx]
+        ascent, descent = self.metrics[idx]
+        fill = MCDU_COLORS.get(color, "white")  # if color is wrong, default to white
+        bitmap = Image.new("RGBA", (self.char_delta, ascent + descent), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(bitmap)
+        origin = (int(self.char_delta / 2), ascent)
+        if char == MCDU_BOX:  # in search of larger rectangular box...
+            bbox = draw.textbbox(origin, text="I", font=font, anchor="ms")
+            # (left, top, right, bottom), taller, narrower
+            sd = 2
+            draw.rectangle(((bbox[0] + sd, bbox[1] + sd), (bbox[2] - sd, bbox[3] + sd)), outline=fill, width=1)
+        elif char != " ":
+            draw.text(origin, text=char, font=font, anchor="ms", fill=fill)
+        return bitmap, ascent
+
+
+def frame_color(color: str) -> int:
+    idx = MCDU_FRAME_COLORS.find(color)
+    return idx if idx >= 0 else MCDU_FRAME_COLORS.index("w")
+
+
+@lru_cache(maxsize=4)
+def get_row_lines(mcdu_unit: int) -> Tuple[tuple, ...]:
+    """Lines displayed on each row of the MCDU screen, lines on the same row are combined."""
+    root = f"{MCDU_ROOT}{mcdu_unit}"
+    rows = [(f"{root}title", f"{root}stitle")]
+    for l in range(1, 7):
+        rows.append((f"{root}label{l}",))
+        rows.append((f"{root}cont{l}", f"{root}scont{l}"))
+    rows.append((f"{root}sp",))
+    return tuple(rows)
+
+
+class MCDUSnapshot(NamedTuple):
+    """Lines of all MCDU units after a set of changes was applied, never modified once published."""
+
+    serial: int
+    lines: Mapping[str, tuple]
+    versions: Mapping[str, int]  # line: incremented each time the line content changes
+    collisions: Mapping[str, tuple]  # line: columns where more than one layer has a character
+    missing: Mapping[str, tuple]  # line: datarefs of layers not received yet, line is displayed without them
+
+    def row_version(self, mcdu_unit: int, row: int) -> tuple:
+        """Versions of the lines of row, changes when row content changes."""
+        return tuple(self.versions.get(key, 0) for key in get_row_lines(mcdu_unit)[row])
+
+    def row_missing(self, mcdu_unit: int, row: int) -> bool:
+        """Whether a line of row, or some layers of it, were not received yet."""
+        return any(key in self.missing or key not in self.lines for key in get_row_lines(mcdu_unit)[row])
+
+    def get_display_row(self, mcdu_unit: int, row: int) -> tuple | None:
+        """Characters displayed on row, lines on the same row combined, large characters first."""
+        lines = [self.lines.get(key) for key in get_row_lines(mcdu_unit)[row]]
+        if len(lines) == 1:
+            return lines[0]
+        large, small = lines
+        if large is None or small is None:
+            return large if small is None else small
+        return tuple(small[i] if large[i][0] == " " else large[i] for i in range(24))
+
+
+EMPTY_SNAPSHOT = MCDUSnapshot(
+    serial=0,
+    lines=MappingProxyType({}),
+    versions=MappingProxyType({}),
+    collisions=MappingProxyType({}),
+    missing=MappingProxyType({}),
+)
+
 
-    def __init__(self) -> None:
-        VariableListener.__init__(self, name="MCDU")
-        self.variables = None
-        self.datarefs = {}
-        self.lines = {}
-        self._first = True
-        self.mcdu_units = [1, 2]
+class MCDU(VariableHub):
+    """Collects MCDU datarefs of all MCDU units and merges them into lines.
+
+    Each dataref is requested once, updates are routed to the lines of their unit.
+    Changes arriving in a burst (page change) are coalesced for window seconds, each changed line
+    is then rebuilt once and registered screens are notified once per unit.
+
+    The listener only records dataref values and queues changes. Lines are built by the coalescing thread
+    into a new MCDUSnapshot published by replacing the snapshot reference, renderers read the latest
+    complete snapshot and never see a page halfway through an update.
+    """
+
+    CALLBACK = "mcdu_changed"  # mcdu_changed(mcdu_unit, lines)
+
+    def __init__(self, window: float = MCDU_COALESCE_WINDOW) -> None:
+        VariableHub.__init__(self, name="MCDU")
+        self.window = window
+        self._changes: queue.Queue = queue.Queue()  # routes of changed datarefs
+        self._flusher: threading.Thread | None = None
+        self._stop = threading.Event()
+        self.mcdu_units = [1, 2, 3]
+        self.unit_variables: Dict[int, set] = {}
+        self.received: Dict[int, int] = {}  # unit: number of display datarefs received, slew keys excluded
+        self.display_counts: Dict[int, int] = {}  # unit: number of display datarefs
+        self.routes: Dict[str, MCDURoute] = {}
+        self.layers: Dict[str, Tuple[MCDULayer, ...]] = {}  # line: its layers
+        self._snapshot = EMPTY_SNAPSHOT
+        self.frames: Dict[int, deque] = {}  # unit: (sequence, row versions, grid), most recent last
+        self._frames_lock = threading.Lock()  # frames are requested by renderers
+        self.make_routes()
+
+    @classmethod
+    def get_hub(cls, simulator, window: float = MCDU_COALESCE_WINDOW) -> "MCDU":
+        """Coalescing window is set per simulator, when its MCDU is created."""
+        mcdu = super().get_hub(simulator, window=window)
+        if mcdu.window != window:
+            logger.warning(f"MCDU coalescing window is {mcdu.window} secs for this simulator, {window} secs ignored")
+        return mcdu
+
+    @property
+    def snapshot(self) -> MCDUSnapshot:
+        """Latest complete lines, renderers should read it once per frame."""
+        return self._snapshot
+
+    @property
+    def lines(self) -> Mapping[str, tuple]:
+        return self._snapshot.lines
 
     def init(self, simulator):
-        for varname in self.get_variables():
-            var = simulator.get_variable(name=varname)
-            var.add_listener(self)
-            # self.datarefs[varname] = var
-        logger.info(f"MCDU requests {len(self.variables)} variables")
+        VariableHub.init(self, simulator=simulator)
+        known = [self.routes[dataref] for dataref in self.datarefs]  # values already received
+        routes = [route for route in known if route.what != SLEW_KEYS]
+        for route in routes:
+            self.received[route.unit] = self.received[route.unit] + 1
+        if len(routes) > 0:
+            self.apply(routes)
+        if self.window > 0:
+            self._flusher = threading.Thread(target=self.run, name="MCDU coalescing", daemon=True)
+            self._flusher.start()
 
-    def get_variables(self) -> set:
-        if self.variables is not None:
-            return self.variables
+    def make_routes(self):
         variables = set()
-        for mcdu_unit in range(1, 2):
-            variables.add(f"{MCDU_ROOT}{mcdu_unit}{SLEW_KEYS}")
-            variables = variables | self.get_variables1unit(mcdu_unit=mcdu_unit)
-        self.variables = variables
-        return variables
+        for mcdu_unit in self.mcdu_units:
+            display = self.get_variables1unit(mcdu_unit=mcdu_unit)
+            self.unit_variables[mcdu_unit] = display | {f"{MCDU_ROOT}{mcdu_unit}{SLEW_KEYS}"}
+            self.display_counts[mcdu_unit] = len(display)
+            self.received[mcdu_unit] = 0
+            variables = variables | self.unit_variables[mcdu_unit]
+        self.routes = {}
+        for dataref in variables:
+            route = get_route(dataref)
+            if route is None:
+                logger.warning(f"no route for {dataref}")
+                continue
+            self.routes[dataref] = route
+        self.layers = {}
+        for route in self.routes.values():
+            if route.what == SLEW_KEYS or route.key in self.layers:
+                continue
+            layers = []
+            for color in route.colors:
+                dataref = f"{route.key}{color}"
+                if dataref not in variables:
+                    continue
+                small = route.what in ["stitle", "scont", "label"] and not color.startswith("L")  # large labels
+                layers.append(MCDULayer(dataref=dataref, color=color[-1], size=1 if small else 0))  # maps Lg, Lw to g, w
+            self.layers[route.key] = tuple(layers)
+
+    def get_variables(self) -> set:
+        return set(self.routes)
 
-    def completed(self) -> bool:
-        # if len(self.datarefs) > (len(self.variables) - 10):
-        #     logger.debug("MCDU waiting for data")
-        #     print([d for d in self.variables if d not in self.datarefs])
-        return len(self.variables) == len(self.datarefs)
+    def get_unit_variables(self, mcdu_unit: int) -> set:
+        return self.unit_variables.get(mcdu_unit, set())
+
+    def readiness(self, mcdu_unit: int) -> float:
+        """Fraction of the display datarefs of unit received"""
+        if self.display_counts.get(mcdu_unit, 0) == 0:
+            return 0.0
+        return self.received[mcdu_unit] / self.display_counts[mcdu_unit]
 
     def get_variables1unit(self, mcdu_unit: int = 1) -> set:
         variables = set()
@@ -82,165 +340,194 @@ class MCDU(VariableListener):
                     variables.add(f"{MCDU_ROOT}{mcdu_unit}{code}{line}{color}")
         return variables
 
-    def get_mcdu_unit(self, dataref) -> int:
-        mcdu_unit = -1
-        if dataref == "AirbusFBW/DUBrightness[6]":  # MCDU screen brightness unit 1
-            return 1
-        elif dataref == "AirbusFBW/DUBrightness[7]":  # MCDU screen brightness unit 2
-            return 2
-        try:
-            m = None
-            if "VertSlewKeys" in dataref:
-                m = re.match("AirbusFBW/MCDU(?P<unit>[1-3])VertSlewKeys", dataref)
-            else:
-                m = re.match(MCDU_DISPLAY_DATA, dataref)
-            if m is None:
-                logger.warning(f"not a display dataref {dataref}")
-                return -1
-            mcdu_unit = int(m["unit"])
-        except:
-            logger.warning(f"error invalid MCDU unit for {dataref}")
-            return -1
-        return mcdu_unit
-
     def variable_changed(self, variable):
         dataref = variable.name
-        value = variable.value
-        self.datarefs[dataref] = value
-        mcdu_unit = self.get_mcdu_unit(dataref)
-
-        if mcdu_unit not in self.mcdu_units:
-            logger.warning(f"invalid MCDU unit {mcdu_unit} ({self.mcdu_units})")
+        route = self.routes.get(dataref)
+        if route is None:
+            logger.debug(f"not a display dataref {dataref}")
             return
+        if dataref in self.datarefs:
+            if self.datarefs[dataref] == variable.value:
+                return
+        elif route.what != SLEW_KEYS:
+            self.received[route.unit] = self.received[route.unit] + 1
+        self.datarefs[dataref] = variable.value
 
-        if dataref not in self.variables:
-            logger.debug(f"not a display dataref {dataref}")
+        if route.unit not in self.mcdu_units:
+            logger.warning(f"invalid MCDU unit {route.unit} ({self.mcdu_units})")
             return
 
-        m = re.match(MCDU_DISPLAY_DATA, dataref)
-        if m is None:
+        if route.what == SLEW_KEYS:
             return
-        colors = "".join([c for c in MCDU_COLORS.keys() if not c.startswith("L")])
-        line = -1
-        what = m.group("name")
-        if what.endswith("title"):  # stitle, title
-            colors = "bgwys"
-        elif what == "sp":
-            colors = "aw"
-        else:  # label, scont, cont
-            line = int(m.group("line"))
-        self.update_line(mcdu_unit=mcdu_unit, line=line, what=what, colors=colors)
-
-    def update_line(self, mcdu_unit: int, line: int, what: str, colors):
-        """Line is 24 characters, 1 character is (<char>, <color>, <small>)."""
-        line_str = "" if line == -1 else str(line)
-        this_line = []
-        for c in range(24):
-            has_char = []
-            size = 1 if what in ["stitle", "scont", "label"] else 0
-            for color in colors:
-                if what.endswith("cont") and color.startswith("L"):
-                    continue
-                if size == 1 and color.startswith("L"):  # small becomes large
-                    size = 0
-                name = f"AirbusFBW/MCDU{mcdu_unit}{what}{line_str}{color}"
-                v = self.datarefs.get(name)
-                if v is None:
-                    # logger.debug(f"no value for dataref {name}")
+        if self._flusher is None:
+            self.apply([route])
+            return
+        self._changes.put(route)
+
+    def run(self):
+        """Collects changes for window seconds after the first one, then applies them all. Runs until close()."""
+        while not self._stop.is_set():
+            routes = [self._changes.get()]
+            deadline = time.monotonic() + self.window
+            while (left := deadline - time.monotonic()) > 0:
+                try:
+                    routes.append(self._changes.get(timeout=left))
+                except queue.Empty:
+                    break
+            if self._stop.is_set():
+                break
+            try:
+                self.apply(routes)
+            except Exception:
+                logger.warning("error applying MCDU changes", exc_info=True)
+        logger.debug("MCDU coalescing stopped")
+
+    def close(self):
+        """Stops the coalescing thread, pending changes are dropped."""
+        self._stop.set()
+        VariableHub.close(self)
+        self._changes.put(None)  # wakes the coalescing thread up
+
+    def apply(self, routes: list):
+        """Rebuilds each changed line once, publishes a new snapshot, then notifies listeners once per unit."""
+        changed: Dict[int, set] = {}
+        for route in routes:
+            changed.setdefault(route.unit, set()).add(route.key)
+        previous = self._snapshot
+        lines = dict(previous.lines)
+        versions = dict(previous.versions)
+        collisions = dict(previous.collisions)
+        missing = dict(previous.missing)
+        for keys in changed.values():
+            for key in keys:
+                line, line_collisions, line_missing = self.merge_line(key)
+                if lines.get(key) != line:
+                    lines[key] = line
+                    versions[key] = versions.get(key, 0) + 1
+                if len(line_collisions) > 0:
+                    collisions[key] = line_collisions
+                    logger.debug(f"multiple characters in {key} at {line_collisions}")
+                else:
+                    collisions.pop(key, None)
+                if len(line_missing) > 0:
+                    missing[key] = line_missing
+                else:
+                    missing.pop(key, None)
+        self._snapshot = MCDUSnapshot(
+            serial=previous.serial + 1,
+            lines=MappingProxyType(lines),
+            versions=MappingProxyType(versions),
+            collisions=MappingProxyType(collisions),
+            missing=MappingProxyType(missing),
+        )
+        for mcdu_unit, keys in changed.items():
+            logger.debug(f"MCDU {mcdu_unit}: {len(keys)} lines updated")
+            self.notify(mcdu_unit=mcdu_unit, lines=keys)
+
+    def merge_line(self, key: str) -> Tuple[tuple, tuple, tuple]:
+        """Merges the color layers of line key in one pass.
+        Line is 24 characters, 1 character is (<char>, <color>, <small>).
+        Where more than one layer has a character, a blank is displayed.
+        Returns the line, the columns where layers collide, and the datarefs of the layers not received yet.
+        """
+        layers = self.layers[key]
+        size = layers[0].size if len(layers) > 0 else 0
+        cells = [None] * 24
+        collisions = set()
+        missing = []
+        for layer in layers:
+            v = self.datarefs.get(layer.dataref)
+            if v is None:
+                missing.append(layer.dataref)
+                continue
+            for c, char in enumerate(v[:24]):
+                if char == " ":
                     continue
-                if c < len(v):
-                    if v[c] != " ":
-                        if color.startswith("L") and len(color) == 2:  # maps Lg, Lw to g, w.
-                            color = color[1]  # prevents "invalid color" further on
-                        if color in MCDU_COLORS:
-                            has_char.append((v[c], color, size))
-                        else:
-                            has_char.append((v[c], color, size))
-            if len(has_char) == 1:
-                this_line = this_line + has_char
-            else:
-                # if len(has_char) > 1:
-                #     logger.debug(f"mutiple char {what}, {c}: {has_char}")
-                this_line.append((" ", "w", size))
-        self.lines[f"AirbusFBW/MCDU{mcdu_unit}{what}{line_str}"] = this_line
-
-    def draw_text(self, mcdu_unit: int, draw, fonts, left_offset: int, char_delta: int, line_bases: list, font_sizes: list) -> bool:
-        """Returns success"""
-
-        def combine(lr, sm):
-            return [sm[i] if lr[i][0] == " " else lr[i] for i in range(24)]
-
-        def show_line(line, y) -> bool:
+                if cells[c] is None:
+                    cells[c] = (char, layer.color, layer.size)
+                else:
+                    collisions.add(c)
+        for c in collisions:
+            cells[c] = None
+        line = tuple([(" ", "w", size) if cell is None else cell for cell in cells])
+        return line, tuple(sorted(collisions)), tuple(missing)
+
+    def row_version(self, mcdu_unit: int, row: int) -> tuple:
+        return self._snapshot.row_version(mcdu_unit=mcdu_unit, row=row)
+
+    def row_missing(self, mcdu_unit: int, row: int) -> bool:
+        return self._snapshot.row_missing(mcdu_unit=mcdu_unit, row=row)
+
+    def get_display_row(self, mcdu_unit: int, row: int) -> tuple | None:
+        return self._snapshot.get_display_row(mcdu_unit=mcdu_unit, row=row)
+
+    # Character grid frames
+    #
+    def get_grid(self, mcdu_unit: int) -> Tuple[int, tuple]:
+        """Returns (sequence, grid) of unit, sequence is incremented each time the grid changes.
+        Grid is MCDU_ROWS rows of 24 (character, color, size) cells, special characters decoded.
+        """
+        with self._frames_lock:
+            return self._get_grid(mcdu_unit=mcdu_unit, snapshot=self._snapshot)
+
+    def _get_grid(self, mcdu_unit: int, snapshot: MCDUSnapshot) -> Tuple[int, tuple]:
+        history = self.frames.setdefault(mcdu_unit, deque(maxlen=MCDU_FRAME_HISTORY))
+        versions = tuple(snapshot.row_version(mcdu_unit=mcdu_unit, row=row) for row in range(MCDU_ROWS))
+        if len(history) > 0 and history[-1][1] == versions:
+            return history[-1][0], history[-1][2]
+        grid = []
+        for row in range(MCDU_ROWS):
+            line = snapshot.get_display_row(mcdu_unit=mcdu_unit, row=row)
             if line is None:
-                logger.debug(f"no line {src}")
-                return False
-            x = left_offset
-            for c in line:
-                if len(c) != 3:
-                    logger.warning(f"invalid character {c}, replaced by white space")
-                    c = (" ", COLORS.WHITE, 0)
-                size = c[2]  # !!! Until now, c[2] = 0 (Large), 1 (small)
-                font = fonts[0] if size > 0 else fonts[1]
-                c = (c[0], c[1], font)  # !!! From now on, c[2] = LARGE font or small font
-                if c[1] == "s":  # "special" characters (rev. eng.)
-                    font_alt = fonts[2] if size > 0 else fonts[3]  # special font too...
-                    if c[0] == "0":
-                        c = ("←", "b", font)
-                    elif c[0] == "1":
-                        c = ("↑", "w", font)
-                    elif c[0] == "2":
-                        c = ("←", "w", font)
-                    elif c[0] == "3":
-                        c = ("→", "w", font)
-                    elif c[0] == "4":
-                        c = ("↓", "w", font)
-                    elif c[0] == "A":
-                        c = ("[", "b", font_alt)
-                    elif c[0] == "B":
-                        c = ("]", "b", font_alt)
-                    elif c[0] == "E":
-                        c = ("☐", "a", font_alt)  # in searh of larger rectangular box...
-                        color = MCDU_COLORS.get(c[1], "white")  # if color is wrong, default to white
-                        # draw.rectangle(((x - int(font_sizes[1]/2), y - font_sizes[1] + 2), (x + int(font_sizes[1]/6), y + 1)), outline=color, width=1)
-                        bbox = draw.textbbox((x, y), text="I", font=c[2], anchor="ms")
-                        # (left, top, right, bottom), taller, narrower
-                        sd = 2
-                        bbox = ((bbox[0] + sd, bbox[1] + sd), (bbox[2] - sd, bbox[3] + sd))
-                        draw.rectangle(bbox, outline=color, width=1)
-                        # print((bbox[2] - bbox[0], bbox[3]-bbox[1]), ( int(font_sizes[1]/2) + int(font_sizes[1]/6), font_sizes[1] + 2 + 1) )
-                if c[0] == "`":  # does not print on terminal
-                    c = ("°", c[1], font)
-                if c[0] != "☐":
-                    color = MCDU_COLORS.get(c[1], "white")  # if color is wrong, default to white
-                    draw.text((x, y), text=c[0], font=c[2], anchor="ms", fill=color)
-                x = x + char_delta
-            return True
-
-        if not self.completed():  # if got all data
-            # logger.debug("MCDU waiting for data")
-            return False
+                line = MCDU_BLANK_ROW
+            grid.append(tuple([display_character(c[0], c[1])[:2] + (c[2],) for c in line]))
+        grid = tuple(grid)
+        if len(history) > 0 and history[-1][2] == grid:  # versions changed, content did not
+            sequence = history[-1][0]
+        else:
+            sequence = history[-1][0] + 1 if len(history) > 0 else 1
+        history.append((sequence, versions, grid))
+        return sequence, grid
 
-        line = combine(self.lines.get(f"AirbusFBW/MCDU{mcdu_unit}title"), self.lines.get(f"AirbusFBW/MCDU{mcdu_unit}stitle"))
-        show_line(line, y=line_bases[0])
-        for l in range(1, 7):
-            show_line(self.lines.get(f"AirbusFBW/MCDU{mcdu_unit}label{l}"), y=line_bases[2 * l - 1])
-            line = combine(self.lines.get(f"AirbusFBW/MCDU{mcdu_unit}cont{l}"), self.lines.get(f"AirbusFBW/MCDU{mcdu_unit}scont{l}"))
-            show_line(line, y=line_bases[2 * l])
-        show_line(self.lines.get(f"AirbusFBW/MCDU{mcdu_unit}sp"), y=line_bases[-1])
-
-        # TO DO
-        # # Additional, non printed keys in lower right corner of display
-        # vertslew_dref = self.set_mcdu_unit(str_in="AirbusFBW/MCDU1VertSlewKeys", mcdu_unit=mcdu_unit)
-        # vertslew_key = self.datarefs.get(self.set_mcdu_unit(str_in="AirbusFBW/MCDU1VertSlewKeys", mcdu_unit=mcdu_unit))
-        # if vertslew_key == 1 or vertslew_key == 2:
-        #     c = (PAGE_CHARS_PER_LINE - 2) * PAGE_BYTES_PER_CHAR
-        #     page[PAGE_LINES - 1][c] = COLORS.WHITE
-        #     page[PAGE_LINES - 1][c + 1] = False
-        #     page[PAGE_LINES - 1][c + 2] = chr(SPECIAL_CHARACTERS.ARROW_UP.value)
-        # if vertslew_key == 1 or vertslew_key == 3:
-        #     c = (PAGE_CHARS_PER_LINE - 1) * PAGE_BYTES_PER_CHAR
-        #     page[PAGE_LINES - 1][c] = COLORS.WHITE
-        #     page[PAGE_LINES - 1][c + 1] = False
-        #     page[PAGE_LINES - 1][c + 2] = chr(SPECIAL_CHARACTERS.ARROW_DOWN.value)
+    def get_frame(self, mcdu_unit: int, since: int | None = None) -> bytes:
+        """Returns the character grid of unit as a compact binary frame.
+        If since is the sequence of a recent frame, returns a delta frame with the cells changed since then,
+        otherwise returns a full frame.
+        """
+        with self._frames_lock:
+            sequence, grid = self._get_grid(mcdu_unit=mcdu_unit, snapshot=self._snapshot)
+            base = None
+            if since is not None:
+                base = next((g for s, v, g in self.frames[mcdu_unit] if s == since), None)
+        if base is None:
+            frame = bytearray(MCDU_FRAME_FULL_HEADER.pack(MCDU_FRAME_FULL, mcdu_unit, sequence, MCDU_ROWS, 24))
+            for line in grid:
+                for c in line:
+                    frame.extend(MCDU_FRAME_CELL.pack(ord(c[0]), frame_color(c[1]), c[2]))
+            return bytes(frame)
+        cells = bytearray()
+        count = 0
+        for row in range(MCDU_ROWS):
+            if grid[row] == base[row]:
+                continue
+            for col in range(24):
+                c = grid[row][col]
+                if c != base[row][col]:
+                    cells.extend(MCDU_FRAME_DELTA_CELL.pack(row, col, ord(c[0]), frame_color(c[1]), c[2]))
+                    count = count + 1
+        return MCDU_FRAME_DELTA_HEADER.pack(MCDU_FRAME_DELTA, mcdu_unit, sequence, since, count) + bytes(cells)
 
+    def draw_line(self, image, line: tuple | None, y: int, atlas: MCDUGlyphAtlas, left_offset: int) -> bool:
+        """Pastes the cells of line on image, centered on left_offset + n * char_delta, with baseline y. Returns success"""
+        if line is None:
+            return False
+        x = left_offset - int(atlas.char_delta / 2)
+        for c in line:
+            if len(c) != 3:
+                logger.warning(f"invalid character {c}, replaced by white space")
+                c = (" ", "w", 0)
+            if c[0] != " ":
+                bitmap, ascent = atlas.cell(*c)
+                image.paste(bitmap, (x, y - ascent))  # cells do not overlap
+            x = x + atlas.char_delta
         return True
@@ -21,13 +21,233 @@
 # "barohg": "sim/cockpit2/gauges/actuators/barometer_setting_in_hg_pilot",
 #
 import logging
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from PIL import Image, ImageDraw
 
 from cockpitdecks.buttons.representation.draw import DrawBase, ICON_SIZE
 from cockpitdecks.strvar import TextWithVariables
 
+from .fcu import FCU, FCU_MODE_DATAREFS, FCU_MODE_FIELDS, FCUDisplay
+
 logger = logging.getLogger(__name__)
 # logger.setLevel(logging.DEBUG)
 
+FCU_FIXED_GLYPHS = "0123456789-+o "  # glyphs drawn in a fixed width cell, right aligned (like a seven segment display)
+FCU_ATLAS_GLYPHS = FCU_FIXED_GLYPHS + "."
+FCU_REFERENCE_SIZES = {  # sizes for which the FCU layouts were designed, coordinates below are in these sizes
+    "horizontal": (8 * ICON_SIZE, ICON_SIZE),  # Elgato Streamdeck Plus touchscreen
+    "vertical-left": (int(2 * ICON_SIZE / 3), 3 * ICON_SIZE),
+    "vertical-right": (int(2 * ICON_SIZE / 3), 3 * ICON_SIZE),
+}
+FCU_REGIONS = {  # horizontal FCU regions (left, top, right, bottom), None is replaced by the bottom of the captions band
+    "speed": (0, 0, 450, ICON_SIZE),
+    "heading": (450, 0, 900, ICON_SIZE),
+    "modes": (900, 0, 1200, ICON_SIZE),  # widened to fit its captions, see FCULayout
+    "altitude-captions": (1200, 0, 8 * ICON_SIZE, None),
+    "altitude": (1200, None, 1640, ICON_SIZE),
+    "vertical-speed": (1640, None, 8 * ICON_SIZE, ICON_SIZE),
+}
+FCU_MODE_CAPTIONS_X = (960, 1080)  # HDG/TRK right aligned, V/S / FPA left aligned, 3 characters each
+FCU_PRERENDER_WORKERS = 2  # threads shared by all FCU icons
+FCU_SPIN_WINDOW = 0.5  # seconds, successive changes in the same direction within this delay are a knob spin
+FCU_ALTITUDE_RANGE = (100, 49000)  # ft, FCU altitude window
+FCU_FRAME_CACHE_SIZE = 32  # frames
+FCU_FRAME_CACHE_BYTES = 32 * 1024 * 1024  # a horizontal FCU frame is 2 MB
+
+
+class FCUGlyphAtlas:
+    """Pre-rasterised glyphs of one font, size and color.
+    Digits, dashes, signs, small zeros and space all advance by the same cell width,
+    narrower glyphs (like the 1 of a seven segment font) are right aligned in their cell.
+    Other characters are rasterised on first use and advance by their own width.
+    """
+
+    _atlases: Dict[tuple, "FCUGlyphAtlas"] = {}  # shared, key is (font name, size, color)
+
+    def __init__(self, font, color):
+        self.font = font
+        self.color = color
+        self.ascent, self.descent = font.getmetrics()
+        self.pad = max(1, int(font.size / 8))  # some glyphs slightly overflow their advance
+        self.cell = max(font.getlength(c) for c in FCU_FIXED_GLYPHS)
+        self.glyphs: Dict[str, Tuple[Image.Image, float, float]] = {}  # char: (bitmap, offset in cell, advance)
+        for c in FCU_ATLAS_GLYPHS:
+            self.glyph(c)
+
+    @classmethod
+    def get_atlas(cls, icon: DrawBase, font_name: str, size: int, color) -> "FCUGlyphAtlas":
+        key = (font_name, size, str(color))
+        atlas = cls._atlases.get(key)
+        if atlas is None:
+            atlas = FCUGlyphAtlas(font=icon.get_font(font_name, size), color=color)
+            cls._atlases[key] = atlas
+            logger.debug(f"glyph atlas {key} created")
+        return atlas
+
+    def glyph(self, c: str) -> Tuple[Image.Image, float, float]:
+        g = self.glyphs.get(c)
+        if g is None:
+            advance = self.font.getlength(c)
+            bitmap = Image.new("RGBA", (int(advance) + 2 * self.pad, self.ascent + self.descent), (0, 0, 0, 0))
+            ImageDraw.Draw(bitmap).text((self.pad, self.ascent), text=c, font=self.font, anchor="ls", fill=self.color)
+            if c in FCU_FIXED_GLYPHS:
+                g = (bitmap, self.cell - advance, self.cell)
+            else:
+                g = (bitmap, 0, advance)
+            self.glyphs[c] = g
+        return g
+
+    def width(self, text: str) -> float:
+        return sum(self.glyph(c)[2] for c in text)
+
+    def text(self, image: Image.Image, xy: tuple, text: str, anchor: str = "ls"):
+        """Pastes text on image at xy. Anchor is a PIL text anchor limited to l/m/r horizontally and s/m vertically."""
+        x, y = xy
+        if anchor[0] == "m":
+            x = x - self.width(text) / 2
+        elif anchor[0] == "r":
+            x = x - self.width(text)
+        top = y - self.ascent  # s, baseline
+        if anchor[1] == "m":
+            top = y - (self.ascent + self.descent) / 2
+        for c in text:
+            bitmap, offset, advance = self.glyph(c)
+            if c != " ":
+                paste(image, bitmap, (round(x + offset) - self.pad, round(top)))
+            x = x + advance
+
+
+class FCULayout:
+    """Geometry of an FCU mode for a given display size.
+    Positions and sizes are expressed in the reference size of the mode and scaled to the display size.
+    Font sizes and margins are scaled uniformly so that texts are not distorted.
+    """
+
+    def __init__(self, mode: str, width: int, height: int, text_size: int, value_size: int):
+        self.mode = mode
+        self.width = width
+        self.height = height
+        ref_width, ref_height = FCU_REFERENCE_SIZES[mode]
+        self.sx = width / ref_width
+        self.sy = height / ref_height
+        self.scale = min(self.sx, self.sy)
+
+        ref_inside = round(0.04 * ICON_SIZE + 0.5)
+        self.inside = self.size(ref_inside)
+        self.text_size = self.size(text_size)
+        self.value_size = self.size(value_size)
+        self.small_value_size = self.size(int(2 * value_size / 3))  # vertical-right values
+        self.sign_size = self.size(int(0.7 * value_size))  # horizontal vertical speed sign
+
+        self.regions: Dict[str, Tuple[int, int, int, int]] = {}
+        if mode == "horizontal":
+            band = min(ref_inside + text_size + int(text_size / 3) + 4, 136)  # 136 = upper point of managed dots
+            for name, box in FCU_REGIONS.items():
+                left, top, right, bottom = [band if v is None else v for v in box]
+                if name == "modes":  # 3 characters captions, a character is at most text_size wide
+                    left = min(left, FCU_MODE_CAPTIONS_X[0] - 3 * text_size)
+                    right = max(right, FCU_MODE_CAPTIONS_X[1] + 3 * text_size)
+                self.regions[name] = (self.x(left), self.y(top), self.x(right), self.y(bottom))
+
+    def x(self, x: float) -> int:
+        return round(x * self.sx)
+
+    def y(self, y: float) -> int:
+        return round(y * self.sy)
+
+    def xy(self, x: float, y: float) -> Tuple[int, int]:
+        return self.x(x), self.y(y)
+
+    def size(self, size: float) -> int:
+        return max(1, round(size * self.scale))
+
+
+@lru_cache(maxsize=16)
+def get_fcu_layout(mode: str, width: int, height: int, text_size: int, value_size: int) -> FCULayout:
+    return FCULayout(mode=mode, width=width, height=height, text_size=text_size, value_size=value_size)
+
+
+class FCUFrameCache:
+    """Least recently used finished FCU images, bounded by number of images and by bytes.
+    Thread safe, pre-rendering threads fill their own cache.
+    """
+
+    def __init__(self, size: int = FCU_FRAME_CACHE_SIZE, max_bytes: int = FCU_FRAME_CACHE_BYTES):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.frames: OrderedDict = OrderedDict()  # key: (image, bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: tuple) -> bool:
+        with self._lock:
+            return key in self.frames
+
+    def get(self, key: tuple) -> Image.Image | None:
+        with self._lock:
+            frame = self.frames.get(key)
+            if frame is None:
+                self.misses = self.misses + 1
+                return None
+            self.frames.move_to_end(key)
+            self.hits = self.hits + 1
+            return frame[0]
+
+    def pop(self, key: tuple) -> Image.Image | None:
+        """Removes and returns the image of key, None if there is none. Does not count as a hit or a miss."""
+        with self._lock:
+            frame = self.frames.pop(key, None)
+            if frame is None:
+                return None
+            self.bytes = self.bytes - frame[1]
+            return frame[0]
+
+    def put(self, key: tuple, image: Image.Image):
+        nbytes = image.width * image.height * len(image.getbands())
+        with self._lock:
+            if key in self.frames:
+                self.bytes = self.bytes - self.frames.pop(key)[1]
+            if self.size < 1 or nbytes > self.max_bytes:
+                return
+            self.frames[key] = (image, nbytes)
+            self.bytes = self.bytes + nbytes
+            while len(self.frames) > self.size or self.bytes > self.max_bytes:
+                _, (_, b) = self.frames.popitem(last=False)
+                self.bytes = self.bytes - b
+
+    def clear(self):
+        with self._lock:
+            self.frames.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "frames": len(self.frames),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit-ratio": round(self.hits / total, 3) if total > 0 else 0.0,
+        }
+
+
+def paste(image: Image.Image, bitmap: Image.Image, xy: tuple):
+    """Alpha composites bitmap on image at xy, clipping whatever falls outside of image."""
+    left, top = max(xy[0], 0), max(xy[1], 0)
+    right, bottom = min(xy[0] + bitmap.width, image.width), min(xy[1] + bitmap.height, image.height)
+    if right <= left or bottom <= top:
+        return
+    image.alpha_composite(bitmap, dest=(left, top), source=(left - xy[0], top - xy[1], right - xy[0], bottom - xy[1]))
+
 
 class FCUIcon(DrawBase):
     """Highly customized class to display FCU on Streamdeck Plus touchscreen (whole screen)."""
@@ -42,16 +262,42 @@ class FCUIcon(DrawBase):
         "value-font": {"type": "font", "meta": {"label": "Font"}},
         "value-size": {"type": "integer", "meta": {"label": "Size"}},
         "value-color": {"type": "color", "meta": {"label": "Color"}},
+        "frame-cache-size": {"type": "integer", "meta": {"label": "Number of rendered images kept"}},
+        "frame-cache-bytes": {"type": "integer", "meta": {"label": "Memory used by rendered images kept (bytes)"}},
+        "prerender": {"type": "integer", "meta": {"label": "Values rendered ahead while a knob is spun, horizontal mode (0 = off)"}},
     }
 
+    _executor: ThreadPoolExecutor | None = None  # pre-rendering threads, shared, created on first use
+
     def __init__(self, button: "Button"):
         DrawBase.__init__(self, button=button)
 
         self.mode: str = self.fcuconfig.get("mode", "horizontal")  # type: ignore # horizontal, vertical-left, vertical-right
         self.icon_color = self.fcuconfig.get("icon-bg-color", "#101010")
+        self.sizes = button._definition.display_size() if button._definition is not None else None
+        self.native = bool(self.sizes)  # rendered at the size of the display, scaled to the key otherwise
+        if not self.native:
+            self.sizes = FCU_REFERENCE_SIZES.get(self.mode, FCU_REFERENCE_SIZES["horizontal"])
 
         self._datarefs: set | None = None
         self._icao = ""  # from which aircraft do we have the set?
+        self._cached = None
+        self._state: Tuple[bool, FCUDisplay] | None = None  # last rendered (connected, display)
+        self._regions: Dict[str, tuple] = {}  # horizontal FCU regions, name: (state, image)
+        self.frames = FCUFrameCache(
+            size=self.fcuconfig.get("frame-cache-size", FCU_FRAME_CACHE_SIZE),
+            max_bytes=self.fcuconfig.get("frame-cache-bytes", FCU_FRAME_CACHE_BYTES),
+        )
+        self.prerender: int = self.fcuconfig.get("prerender", 0)
+        self.ahead = FCUFrameCache(size=2 * self.prerender, max_bytes=FCU_FRAME_CACHE_BYTES)  # pre-rendered frames, heading and altitude
+        self._spins: Dict[str, tuple] = {}  # value name: (value, time, direction)
+        self._prerendering: Future | None = None
+        self._generation = 0  # incremented when a new pre-rendering job supersedes the running one
+
+        self.fields = FCU_MODE_FIELDS.get(self.mode, FCU_MODE_FIELDS["horizontal"])
+        self._updated = True
+        self.fcu = FCU.get_hub(simulator=button.sim)
+        self.fcu.register(self)
 
         self._display_text = TextWithVariables(owner=button, config=self.fcuconfig, prefix="text")
         self._display_value = TextWithVariables(owner=button, config=self.fcuconfig, prefix="value")
@@ -72,680 +318,404 @@ class FCUIcon(DrawBase):
             return self._datarefs
 
         self._datarefs = set()
-        if self.mode == "vertical-left":
-            self._datarefs = {
-                "sim/cockpit2/autopilot/airspeed_dial_kts_mach",
-                "sim/cockpit/autopilot/heading_mag",
-                "sim/cockpit/autopilot/airspeed_is_mach",
-                "AirbusFBW/HDGTRKmode",
-                "AirbusFBW/SPDmanaged",
-                "AirbusFBW/HDGmanaged",
-                "AirbusFBW/SPDdashed",
-                "AirbusFBW/HDGdashed",
-                "AirbusFBW/BaroStdCapt",
-                "AirbusFBW/BaroUnitCapt",
-                "sim/cockpit2/gauges/actuators/barometer_setting_in_hg_pilot",
-            }
-        elif self.mode == "vertical-right":
-            self._datarefs = {
-                "sim/cockpit2/autopilot/altitude_dial_ft",
-                "sim/cockpit/autopilot/vertical_velocity",
-                "AirbusFBW/HDGTRKmode",
-                "AirbusFBW/ALTmanaged",
-                "AirbusFBW/VSdashed",
-            }
-        elif self.mode == "horizontal":
-            self._datarefs = {
-                "sim/cockpit2/autopilot/airspeed_dial_kts_mach",
-                "sim/cockpit/autopilot/heading_mag",
-                "sim/cockpit/autopilot/airspeed_is_mach",
-                "sim/cockpit2/autopilot/altitude_dial_ft",
-                "sim/cockpit/autopilot/vertical_velocity",
-                "AirbusFBW/HDGTRKmode",
-                "AirbusFBW/SPDmanaged",
-                "AirbusFBW/HDGmanaged",
-                "AirbusFBW/ALTmanaged",
-                "AirbusFBW/SPDdashed",
-                "AirbusFBW/HDGdashed",
-                "AirbusFBW/VSdashed",
-            }
+        if self.mode in FCU_MODE_DATAREFS:
+            self._datarefs = FCU_MODE_DATAREFS[self.mode]
         else:
             logger.warning(f"invalid mode {self.mode}")
         if len(self._datarefs) > 1:
             self._icao = self.aircraft_icao
         return self._datarefs
 
-    def get_image_for_icon(self):
-        if self.mode == "vertical-left":
-            return self.get_image_for_icon_vertical_left()
-        elif self.mode == "vertical-right":
-            return self.get_image_for_icon_vertical_right()
-        elif self.mode != "horizontal":
-            logger.warning(f"invalid mode {self.mode}, using horizontal mode")
-        return self.get_image_for_icon_horizontal()
-
-    def get_image_for_icon_horizontal(self):
-        """
-        FCU display on Streamdeck Plus touchscreen.
-        (This is currently more or less hardcoded for Elgato Streamdeck Plus touchscreen.)
-        """
-        self.inc("update")
-        THIS_WIDTH = 8 * ICON_SIZE
-        THIS_HEIGHT = ICON_SIZE
-        image, draw = self.double_icon(width=THIS_WIDTH, height=THIS_HEIGHT)
-
-        inside = round(0.04 * ICON_SIZE + 0.5)
-
-        # demo through default values
-        #
-        mach_mode = self.button.get_simulator_variable_value("sim/cockpit/autopilot/airspeed_is_mach", default=0) == 1
-        heading_mode = self.button.get_simulator_variable_value("AirbusFBW/HDGTRKmode", default=1) == 0
-
-        # print("\n".join(self.button.page.datarefs.keys()))
-        # print(
-        #     ">>>>>>>",
-        #     self.count,
-        #     mach_mode,
-        #     heading_mode,
-        #     self.button.get_simulator_variable_value("sim/cockpit2/autopilot/airspeed_dial_kts_mach"),
-        #     self.button.get_simulator_variable_value("sim/cockpit/autopilot/heading_mag"),
-        #     self.button.get_simulator_variable_value("sim/cockpit2/autopilot/altitude_dial_ft"),
-        #     self.button.get_simulator_variable_value("sim/cockpit/autopilot/vertical_velocity"),
-        # )
-
-        # static texts
-        font = self.get_font(self._display_text.font, self._display_text.size)
-        h = self._display_text.size + inside
-        if mach_mode:
-            draw.text(
-                (150, h),
-                text="MACH",
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_text.color,
-            )
-        else:
-            draw.text(
-                (inside, h),
-                text="SPD",
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_text.color,
-            )
+    def fcu_state(self) -> Tuple[bool, FCUDisplay]:
+        """What the FCU displays, values quantised as displayed, and whether it is connected."""
+        return self.button.sim.connected, self.fcu.display
 
-        draw.text((720, h), text="LAT", font=font, anchor="ls", align="left", fill=self._display_text.color)
-        if heading_mode:
-            draw.text(
-                (460, h),
-                text="HDG",
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_text.color,
-            )
-            draw.text(
-                (960, 120),
-                text="HDG",
-                font=font,
-                anchor="rs",
-                align="right",
-                fill=self._display_text.color,
-            )
-        else:
-            draw.text(
-                (590, h),
-                text="TRK",
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_text.color,
-            )
-            draw.text(
-                (960, 220),
-                text="TRK",
-                font=font,
-                anchor="rs",
-                align="right",
-                fill=self._display_text.color,
-            )
+    def fcu_changed(self, display: FCUDisplay, fields: set):
+        """Called by the shared FCU with the display fields that changed."""
+        if len(fields & self.fields) > 0:
+            self._updated = True
 
-        if heading_mode:
-            draw.text(
-                (1080, 120),
-                text="V/S",
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_text.color,
-            )
-            draw.text(
-                (1880, h),
-                text="V/S",
-                font=font,
-                anchor="rs",
-                align="right",
-                fill=self._display_text.color,
-            )
+    def is_updated(self) -> bool:
+        # Values jitter below display resolution, only redraw when a displayed field changes.
+        connected, display = self.fcu_state()  # derives display and notifies if necessary
+        if self._state is not None and connected == self._state[0] and not self._updated:
+            return False
+        logger.debug(f"button {self.button.name}: FCU changed")
+        self._updated = False
+        return True
+
+    def frame_key(self, connected: bool, display: FCUDisplay) -> tuple:
+        """Frame cache key, only contains the fields displayed in this mode."""
+        return (self.mode, connected) + tuple(getattr(display, f) for f in FCUDisplay._fields if f in self.fields)
+
+    def get_image_for_icon(self):
+        connected, display = self._state = self.fcu_state()
+        key = self.frame_key(connected, display)
+        frame = self.frames.get(key)
+        if frame is None:
+            frame = self.ahead.pop(key)
+            if frame is not None:
+                self.inc("frame-prerender-hit")
+                self.frames.put(key, frame)
+        if frame is not None:
+            self.inc("frame-cache-hit")
         else:
-            draw.text(
-                (1080, 220),
-                text="FPA",
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_text.color,
-            )
-            draw.text(
-                (THIS_WIDTH - inside, h),
-                text="FPA",
-                font=font,
-                anchor="rs",
-                align="right",
-                fill=self._display_text.color,
-            )
+            self.inc("frame-cache-miss")
+            if self.mode == "vertical-left":
+                frame = self.get_image_for_icon_vertical_left(connected=connected, display=display)
+            elif self.mode == "vertical-right":
+                frame = self.get_image_for_icon_vertical_right(connected=connected, display=display)
+            else:
+                if self.mode != "horizontal":
+                    logger.warning(f"invalid mode {self.mode}, using horizontal mode")
+                frame = self.get_image_for_icon_horizontal(connected=connected, display=display)
+            self.frames.put(key, frame)
+        if self.prerender > 0 and connected and self.mode == "horizontal":
+            self.check_spin(display)
+        self._cached = frame
+        return self._cached
 
-        draw.text((1320, h), text="ALT", font=font, anchor="ls", align="left", fill=self._display_text.color)
-        draw.text(
-            (1600, h),
-            text="LVL/CH",
-            font=font,
-            anchor="ms",
-            align="center",
-            fill=self._display_text.color,
-        )
+    # Knob spins
+    #
+    def check_spin(self, display: FCUDisplay):
+        """Detects heading or altitude knob spins from successive displayed values
+        and renders the next values in the direction of the spin in the background.
+        """
+        now = time.monotonic()
+        ahead = []
+        if display.heading.isdigit():
+            heading = int(display.heading)
+            direction = self.spin_direction("heading", heading, now, modulo=360)
+            if direction != 0:
+                ahead = ahead + [("heading", display._replace(heading=f"{(heading + i * direction) % 360:03d}")) for i in range(1, self.prerender + 1)]
+        if display.altitude.strip().isdigit():
+            altitude = int(display.altitude)
+            last = self._spins.get("altitude")
+            direction = self.spin_direction("altitude", altitude, now)
+            if direction != 0:
+                step = 1000 if abs(altitude - last[0]) >= 1000 else 100
+                for i in range(1, self.prerender + 1):
+                    value = altitude + i * direction * step
+                    if FCU_ALTITUDE_RANGE[0] <= value <= FCU_ALTITUDE_RANGE[1]:
+                        ahead.append(("altitude", display._replace(altitude=f"{value: 5d}")))
+        ahead = [(name, d) for name, d in ahead if self.frame_key(True, d) not in self.frames and self.frame_key(True, d) not in self.ahead]
+        if len(ahead) > 0:
+            self.prerender_ahead(display=display, ahead=ahead)
+
+    def spin_direction(self, name: str, value: int, now: float, modulo: int = 0) -> int:
+        """Returns 1 or -1 if value is a knob spin step in the same direction as the previous one, 0 otherwise."""
+        last = self._spins.get(name)
+        if last is None or last[0] == value:
+            if last is None:
+                self._spins[name] = (value, now, 0)
+            return 0
+        delta = value - last[0]
+        if modulo > 0:  # shortest way around
+            delta = (delta + modulo / 2) % modulo - modulo / 2
+        direction = 1 if delta > 0 else -1
+        spinning = direction == last[2] and now - last[1] < FCU_SPIN_WINDOW
+        self._spins[name] = (value, now, direction)
+        return direction if spinning else 0
+
+    def prerender_ahead(self, display: FCUDisplay, ahead: list):
+        """Prepares what needs fonts, counters or the deck on the render thread,
+        then submits the pre-rendering of ahead, a list of (region name, display), to the shared threads.
+        """
+        layout = self.layout
+        atlas = self.value_atlas(layout.value_size)
+        for _, d in ahead:
+            atlas.width(d.heading + d.altitude)  # rasterises missing glyphs here
+        tiles = {name: self.get_region(name=name, layout=layout, state=state, display=display) for name, state in self.region_states(True, display).items()}
+        bases = {}  # captions only tiles of spun regions
+        for name in {name for name, _ in ahead}:
+            box = layout.regions[name]
+            bases[name], draw = self.double_icon(width=box[2] - box[0], height=box[3] - box[1])
+            self.region_painter(name)(image=bases[name], draw=draw, layout=layout, display=display, connected=False, dx=box[0], dy=box[1])
+        canvas, _ = self.double_icon(width=layout.width, height=layout.height)
+        background = self.get_background(layout=layout, color=self.icon_color)
+
+        self._generation = self._generation + 1
+        if self._prerendering is not None:
+            self._prerendering.cancel()  # not started yet, superseded
+        if FCUIcon._executor is None:
+            FCUIcon._executor = ThreadPoolExecutor(max_workers=FCU_PRERENDER_WORKERS, thread_name_prefix="fcu-prerender")
+        self._prerendering = FCUIcon._executor.submit(self.render_ahead, self._generation, layout, atlas, tiles, bases, canvas, background, ahead)
+
+    def render_ahead(self, generation: int, layout: FCULayout, atlas: FCUGlyphAtlas, tiles: dict, bases: dict, canvas, background, ahead: list):
+        """Composes frames of ahead from prepared tiles, runs on pre-rendering threads and only uses PIL.
+        Frames go to their own cache so that they never evict frames in use.
+        """
+        painters = {"heading": self.draw_heading_value, "altitude": self.draw_altitude_value}
+        try:
+            for name, display in ahead:
+                if generation != self._generation:
+                    logger.debug(f"button {self.button.name}: pre-rendering superseded")
+                    return
+                box = layout.regions[name]
+                tile = bases[name].copy()
+                painters[name](image=tile, draw=ImageDraw.Draw(tile), layout=layout, display=display, atlas=atlas, dx=box[0], dy=box[1])
+                image = canvas.copy()
+                for region, region_tile in tiles.items():
+                    image.alpha_composite(tile if region == name else region_tile, dest=layout.regions[region][:2])
+                frame = background.copy()
+                frame.alpha_composite(image)
+                self.ahead.put(self.frame_key(True, display), frame)
+        except Exception:
+            logger.warning(f"button {self.button.name}: pre-rendering failed", exc_info=True)
+            return
+        logger.debug(f"button {self.button.name}: {len(ahead)} values rendered ahead")
 
-        # line
-        h = inside + self._display_text.size / 2 + 4
-        draw.line([(1410, h), (1510, h)], fill=self._display_text.color, width=3, joint="curve")
-        draw.line(
-            [(1410, h), (1410, h + self._display_text.size / 3)],
-            fill=self._display_text.color,
-            width=3,
-            joint="curve",
-        )
-        draw.line([(1700, h), (1800, h)], fill=self._display_text.color, width=3, joint="curve")
-        draw.line(
-            [(1800, h), (1800, h + self._display_text.size / 3)],
-            fill=self._display_text.color,
-            width=3,
-            joint="curve",
+    @property
+    def layout(self) -> FCULayout:
+        mode = self.mode if self.mode in FCU_REFERENCE_SIZES else "horizontal"
+        return get_fcu_layout(
+            mode=mode, width=int(self.sizes[0]), height=int(self.sizes[1]), text_size=self._display_text.size, value_size=self._display_value.size
         )
 
-        if not self.button.sim.connected:
-            logger.debug("not connected")
-            bg = self.button.deck.get_icon_background(
-                name=self.button_name,
-                width=THIS_WIDTH,
-                height=THIS_HEIGHT,
-                texture_in=None,
-                color_in="black",
-                use_texture=False,
-                who="FMA",
-            )
-            bg.alpha_composite(image)
-            self._cached = bg
-            return self._cached
-
-        # values
-        # pylint: disable=W0612
-        font = self.get_font(self._display_value.font, self._display_value.size)
-        one = " 1" if self._display_value.font == "Seven Segment" else "1"
-        h = 200
-        dot_size = 24
-        hdot = 160
-
-        #
-        # SPEED
-        speed_managed = self.button.get_simulator_variable_value("AirbusFBW/SPDmanaged", default=0) == 1
-        speed = "---"
-        speed_dashed = self.button.get_simulator_variable_value("AirbusFBW/SPDdashed", default=0) == 1
-        if speed_dashed:
-            draw.text(
-                (20, h),
-                text=speed,
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_value.color,
-            )
-        else:
-            spdft = 0.56 if mach_mode else 249
-            speed_val = self.button.get_simulator_variable_value("sim/cockpit2/autopilot/airspeed_dial_kts_mach", default=spdft)
-            if speed_val is not None:
-                if mach_mode:
-                    speed_val = round(speed_val * 100) / 100
-                    speed = f"{speed_val:4.2f}"
-                else:
-                    speed_val = int(round(speed_val, 0))
-                    speed = f"{speed_val:3d}"
-            draw.text(
-                (20, h),
-                text=speed.replace("1", one),
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_value.color,
-            )
-        if speed_managed:
-            w = 250
-            dot = ((w - dot_size, hdot - dot_size), (w + dot_size, hdot + dot_size))
-            draw.ellipse(dot, fill=self._display_value.color)
-        #
-        # HEADING
-        heading_managed = self.button.get_simulator_variable_value("AirbusFBW/HDGmanaged", default=0) == 1
-        heading_dashed = self.button.get_simulator_variable_value("AirbusFBW/HDGdashed", default=0) == 1
-        if heading_dashed:
-            heading = "---"
-            draw.text(
-                (500, h),
-                text=heading,
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_value.color,
-            )
-        else:
-            heading_val = self.button.get_simulator_variable_value("sim/cockpit/autopilot/heading_mag", 0)
-            heading_val = int(round(heading_val, 0))
-            heading = f"{heading_val:03d}"
-            draw.text(
-                (500, h),
-                text=heading.replace("1", one),
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_value.color,
-            )
-        if heading_managed:
-            w = 736
-            dot = ((w - dot_size, hdot - dot_size), (w + dot_size, hdot + dot_size))
-            draw.ellipse(dot, fill=self._display_value.color)
-        #
-        # ALTITUDE (always displayed)
-        alt_managed = self.button.get_simulator_variable_value("AirbusFBW/ALTmanaged", default=0) == 1
-        vs_dashed = self.button.get_simulator_variable_value("AirbusFBW/VSdashed", False)
-        alt_ft_val = self.button.get_simulator_variable_value("sim/cockpit2/autopilot/altitude_dial_ft", 26789)
-        alt_ft_val = int(round(alt_ft_val, 0))
-        alt = f"{alt_ft_val: 5d}"
-        draw.text(
-            (1240, h),
-            text=alt.replace("1", one),
-            font=font,
-            anchor="ls",
-            align="left",
-            fill=self._display_value.color,
-        )  # should always be len=5
-        if alt_managed:
-            w = 1590
-            dot = ((w - dot_size, hdot - dot_size), (w + dot_size, hdot + dot_size))
-            draw.ellipse(dot, fill=self._display_value.color)
-
-        # Vertical speed/slope is tricky
-        vs_val = -1
-        if alt_managed or vs_dashed:
-            vs = "----" if heading_mode else "-.---"
-            draw.text(
-                (1700, h),
-                text=vs.replace("1", one),
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_value.color,
-            )  # should always be len=5 or 6
-        else:
-            vsdft = -1200 if heading_mode else -2.5
-            vs_val = self.button.get_simulator_variable_value("sim/cockpit/autopilot/vertical_velocity", default=vsdft)
-            vs_val_abs = abs(vs_val)
-            vs = ""
-            if heading_mode:  # V/S
-                vs_val_abs = abs(int(vs_val / 100))
-                vs = f"{vs_val_abs:02d}" + "oo"  # little zeros
-            else:  # FPA
-                vs_val_abs = abs(round(vs_val * 10) / 10)
-                vs = f"{vs_val_abs:3.1f}"
-            # print(">>>", vs_val, heading_mode, alt_managed, vs)
-            draw.text(
-                (1700, h),
-                text=vs.replace("1", one),
-                font=font,
-                anchor="ls",
-                align="left",
-                fill=self._display_value.color,
-            )  # should always be len=5 or 6
-        # little + or - in front of vertical speed
-        font = self.get_font("Seven Segment", int(0.7 * self._display_value.size))
-        vs = "-" if vs_val < 0 else "+"
-        draw.text(
-            (1650, h - 16),
-            text=vs,
-            font=font,
-            anchor="ls",
-            align="left",
-            fill=self._display_value.color,
-        )  # should always be len=5 or 6
-
-        # Paste image on cockpit background and return it.
-        bg = self.button.deck.get_icon_background(
+    def get_background(self, layout: FCULayout, color):
+        return self.button.deck.get_icon_background(
             name=self.button_name,
-            width=THIS_WIDTH,
-            height=THIS_HEIGHT,
+            width=layout.width,
+            height=layout.height,
             texture_in=None,
-            color_in=self.icon_color,
+            color_in=color,
             use_texture=False,
             who="FCU",
         )
-        bg.alpha_composite(image)
-        self._cached = bg
-        return self._cached
 
-    def get_image_for_icon_vertical_left(self):
-        """Speed, heading, QNH"""
-        self.inc("update")
-        THIS_WIDTH = int(2 * ICON_SIZE / 3)
-        THIS_HEIGHT = 3 * ICON_SIZE
-        image, draw = self.double_icon(width=THIS_WIDTH, height=THIS_HEIGHT)
+    def get_image_for_icon_horizontal(self, connected: bool, display: FCUDisplay):
+        """
+        FCU display on Streamdeck Plus touchscreen, or any other wide display.
 
-        inside = round(0.04 * ICON_SIZE + 0.5)
+        The FCU is split into regions, each region is only redrawn when what it displays changed.
+        """
+        self.inc("update")
+        layout = self.layout
+        image, draw = self.double_icon(width=layout.width, height=layout.height)
 
-        mach_mode = self.button.get_simulator_variable_value("sim/cockpit/autopilot/airspeed_is_mach", default=0) == 1
-        heading_mode = self.button.get_simulator_variable_value("AirbusFBW/HDGTRKmode", default=1) == 0
+        for name, state in self.region_states(connected, display).items():
+            box = layout.regions[name]
+            image.alpha_composite(self.get_region(name=name, layout=layout, state=state, display=display), dest=box[:2])
 
-        font = self.get_font(self._display_text.font, self._display_text.size)
-        h = inside + self._display_text.size
-        centerx = image.width / 2
-        txt = "MACH" if mach_mode else "SPD"
-        draw.text(
-            (centerx, h),
-            text=txt,
-            font=font,
-            anchor="ms",
-            align="center",
-            fill=self._display_text.color,
-        )
+        # Paste image on cockpit background and return it.
+        bg = self.get_background(layout=layout, color=self.icon_color if connected else "black")
+        bg.alpha_composite(image)
+        self._cached = bg
+        return self._cached
 
-        txt = "HDG" if heading_mode else "TRK"
-        draw.text(
-            (centerx, h + ICON_SIZE),
-            text=txt,
-            font=font,
-            anchor="ms",
-            align="center",
-            fill=self._display_text.color,
+    def region_states(self, connected: bool, display: FCUDisplay) -> Dict[str, tuple]:
+        """What each horizontal region displays, in drawing order."""
+        return {
+            "speed": (connected, display.mach, display.speed, display.speed_managed),
+            "heading": (connected, display.heading_mode, display.heading, display.heading_managed),
+            "modes": (display.heading_mode,),
+            "altitude-captions": (display.heading_mode,),
+            "altitude": (connected, display.altitude, display.altitude_managed),
+            "vertical-speed": (connected, display.heading_mode, display.vertical_speed, display.vertical_speed_negative),
+        }
+
+    def get_region(self, name: str, layout: FCULayout, state: tuple, display: FCUDisplay):
+        """Returns the image of region name, redrawn only if its state changed."""
+        box = layout.regions[name]
+        cached = self._regions.get(name)
+        if cached is not None and cached[0] == (box, state):
+            return cached[1]
+        tile, draw = self.double_icon(width=box[2] - box[0], height=box[3] - box[1])
+        painter = self.region_painter(name)
+        painter(image=tile, draw=draw, layout=layout, display=display, connected=state[0], dx=box[0], dy=box[1])
+        self._regions[name] = ((box, state), tile)
+        logger.debug(f"region {name} updated")
+        return tile
+
+    def region_painter(self, name: str):
+        return {
+            "speed": self.draw_speed_region,
+            "heading": self.draw_heading_region,
+            "modes": self.draw_modes_region,
+            "altitude-captions": self.draw_altitude_captions_region,
+            "altitude": self.draw_altitude_region,
+            "vertical-speed": self.draw_vertical_speed_region,
+        }[name]
+
+    def draw_caption(self, draw, layout: FCULayout, xy: tuple, text: str, anchor: str = "ls", align: str = "left"):
+        font = self.get_font(self._display_text.font, layout.text_size)
+        draw.text(xy, text=text, font=font, anchor=anchor, align=align, fill=self._display_text.color)
+
+    def value_atlas(self, size: int, font: str | None = None) -> FCUGlyphAtlas:
+        return FCUGlyphAtlas.get_atlas(
+            icon=self,
+            font_name=font if font is not None else self._display_value.font,
+            size=size,
+            color=self._display_value.color,
         )
 
-        draw.text(
-            (centerx, h + 2 * ICON_SIZE),
-            text="QNH",
-            font=font,
-            anchor="ms",
-            align="center",
-            fill=self._display_text.color,
-        )
+    def draw_managed_dot(self, draw, center: tuple, radius: int, color=None):
+        x, y = center
+        draw.ellipse(((x - radius, y - radius), (x + radius, y + radius)), fill=self._display_value.color if color is None else color)
 
-        if not self.button.sim.connected:
-            logger.debug("not connected")
-            bg = self.button.deck.get_icon_background(
-                name=self.button_name,
-                width=THIS_WIDTH,
-                height=THIS_HEIGHT,
-                texture_in=None,
-                color_in="black",
-                use_texture=False,
-                who="FMA",
-            )
-            bg.alpha_composite(image)
-            bg = self.button.deck.scale_icon_for_key(self.button.index, bg)
-            self._cached = bg
-            return self._cached
-
-        # values
-        font = self.get_font(self._display_value.font, self._display_value.size)
-        one = " 1" if self._display_value.font == "Seven Segment" else "1"
-        dot_size = 10
-        wdot = image.width - inside - dot_size * 2
-
-        #
-        # SPEED
-        speed_managed = self.button.get_simulator_variable_value("AirbusFBW/SPDmanaged", default=0) == 1
-        speed_dashed = self.button.get_simulator_variable_value("AirbusFBW/SPDdashed", default=0) == 1
-        h = ICON_SIZE / 2
-        speed = "---"
-        if speed_dashed:
-            draw.text(
-                (centerx, h),
-                text=speed,
-                font=font,
-                anchor="mm",
-                align="center",
-                fill=self._display_value.color,
-            )
+    def draw_speed_region(self, image, draw, layout: FCULayout, display: FCUDisplay, connected: bool, dx: int, dy: int):
+        h = layout.text_size + layout.inside - dy
+        if display.mach:
+            self.draw_caption(draw, layout, (layout.x(150) - dx, h), "MACH")
         else:
-            spdft = 0.56 if mach_mode else 249
-            speed_val = self.button.get_simulator_variable_value("sim/cockpit2/autopilot/airspeed_dial_kts_mach", default=spdft)
-            if speed_val is not None:
-                if mach_mode:
-                    speed_val = round(speed_val * 100) / 100
-                    speed = f"{speed_val:4.2f}"
-                else:
-                    speed_val = int(round(speed_val, 0))
-                    speed = f"{speed_val:3d}"
-            draw.text(
-                (centerx, h),
-                text=speed.replace("1", one),
-                font=font,
-                anchor="mm",
-                align="center",
-                fill=self._display_value.color,
-            )
-        if speed_managed:
-            dot = ((wdot - dot_size, h - dot_size), (wdot + dot_size, h + dot_size))
-            draw.ellipse(dot, fill=self._display_value.color)
-        #
-        # HEADING
-        heading_managed = self.button.get_simulator_variable_value("AirbusFBW/HDGmanaged", default=0) == 1
-        heading_dashed = self.button.get_simulator_variable_value("AirbusFBW/HDGdashed", default=0) == 1
-        h = 3 * ICON_SIZE / 2
-        if heading_dashed:
-            heading = "---"
-            draw.text(
-                (centerx, h),
-                text=heading,
-                font=font,
-                anchor="mm",
-                align="center",
-                fill=self._display_value.color,
-            )
+            self.draw_caption(draw, layout, (layout.inside - dx, h), "SPD")
+        if not connected:
+            return
+        self.value_atlas(layout.value_size).text(image, (layout.x(20) - dx, layout.y(200) - dy), display.speed)
+        if display.speed_managed:
+            self.draw_managed_dot(draw, (layout.x(250) - dx, layout.y(160) - dy), layout.size(24))
+
+    def draw_heading_region(self, image, draw, layout: FCULayout, display: FCUDisplay, connected: bool, dx: int, dy: int):
+        h = layout.text_size + layout.inside - dy
+        self.draw_caption(draw, layout, (layout.x(720) - dx, h), "LAT")
+        if display.heading_mode:
+            self.draw_caption(draw, layout, (layout.x(460) - dx, h), "HDG")
         else:
-            heading_val = self.button.get_simulator_variable_value("sim/cockpit/autopilot/heading_mag", 0)
-            heading_val = int(round(heading_val, 0))
-            heading = f"{heading_val:03d}"
-            draw.text(
-                (centerx, h),
-                text=heading.replace("1", one),
-                font=font,
-                anchor="mm",
-                align="center",
-                fill=self._display_value.color,
-            )
-        if heading_managed:
-            dot = ((wdot - dot_size, h - dot_size), (wdot + dot_size, h + dot_size))
-            draw.ellipse(dot, fill=self._display_value.color)
-        #
-        # QNH
-        qnh_std = self.button.get_simulator_variable_value("AirbusFBW/BaroStdCapt", 0) == 1
-        h = 5 * ICON_SIZE / 2
-        qnh = "Std"
-        if qnh_std:
-            draw.text(
-                (centerx, h),
-                text=qnh,
-                font=font,
-                anchor="mm",
-                align="center",
-                fill=self._display_value.color,
-            )
+            self.draw_caption(draw, layout, (layout.x(590) - dx, h), "TRK")
+        if not connected:
+            return
+        self.draw_heading_value(image, draw, layout, display, atlas=self.value_atlas(layout.value_size), dx=dx, dy=dy)
+
+    def draw_heading_value(self, image, draw, layout: FCULayout, display: FCUDisplay, atlas: FCUGlyphAtlas, dx: int, dy: int):
+        """Heading value and managed dot, only uses PIL and atlas (also called by pre-rendering threads)."""
+        atlas.text(image, (layout.x(500) - dx, layout.y(200) - dy), display.heading)
+        if display.heading_managed:
+            self.draw_managed_dot(draw, (layout.x(736) - dx, layout.y(160) - dy), layout.size(24), color=atlas.color)
+
+    def draw_modes_region(self, image, draw, layout: FCULayout, display: FCUDisplay, connected: bool, dx: int, dy: int):
+        h = layout.y(120 if display.heading_mode else 220) - dy
+        self.draw_caption(draw, layout, (layout.x(FCU_MODE_CAPTIONS_X[0]) - dx, h), "HDG" if display.heading_mode else "TRK", anchor="rs", align="right")
+        self.draw_caption(draw, layout, (layout.x(FCU_MODE_CAPTIONS_X[1]) - dx, h), "V/S" if display.heading_mode else "FPA")
+
+    def draw_altitude_captions_region(self, image, draw, layout: FCULayout, display: FCUDisplay, connected: bool, dx: int, dy: int):
+        h = layout.text_size + layout.inside - dy
+        if display.heading_mode:
+            self.draw_caption(draw, layout, (layout.x(1880) - dx, h), "V/S", anchor="rs", align="right")
         else:
-            qnh_val = self.button.get_simulator_variable_value("sim/cockpit2/gauges/actuators/barometer_setting_in_hg_pilot", 0)
-            qnh_metric = self.button.get_simulator_variable_value("AirbusFBW/BaroUnitCapt", 1) == 1
-            if qnh_metric:
-                qnh_val = int(round(float(qnh_val) * 33.8639, 0))
-                qnh = f"{qnh_val:04d}"
-            else:
-                qnh_val = round(float(qnh_val), 2)
-                qnh = f"{qnh_val:5.2f}"
+            self.draw_caption(draw, layout, (layout.width - layout.inside - dx, h), "FPA", anchor="rs", align="right")
+        self.draw_caption(draw, layout, (layout.x(1320) - dx, h), "ALT")
+        self.draw_caption(draw, layout, (layout.x(1600) - dx, h), "LVL/CH", anchor="ms", align="center")
+
+        # line
+        h = layout.inside + layout.text_size / 2 + layout.size(4) - dy
+        tick = layout.text_size / 3
+        color = self._display_text.color
+        width = layout.size(3)
+        left, right = layout.x(1410) - dx, layout.x(1510) - dx
+        draw.line([(left, h), (right, h)], fill=color, width=width, joint="curve")
+        draw.line([(left, h), (left, h + tick)], fill=color, width=width, joint="curve")
+        left, right = layout.x(1700) - dx, layout.x(1800) - dx
+        draw.line([(left, h), (right, h)], fill=color, width=width, joint="curve")
+        draw.line([(right, h), (right, h + tick)], fill=color, width=width, joint="curve")
+
+    def draw_altitude_region(self, image, draw, layout: FCULayout, display: FCUDisplay, connected: bool, dx: int, dy: int):
+        if not connected:
+            return
+        self.draw_altitude_value(image, draw, layout, display, atlas=self.value_atlas(layout.value_size), dx=dx, dy=dy)
+
+    def draw_altitude_value(self, image, draw, layout: FCULayout, display: FCUDisplay, atlas: FCUGlyphAtlas, dx: int, dy: int):
+        """Altitude value and managed dot, only uses PIL and atlas (also called by pre-rendering threads)."""
+        atlas.text(image, (layout.x(1240) - dx, layout.y(200) - dy), display.altitude)
+        if display.altitude_managed:
+            self.draw_managed_dot(draw, (layout.x(1590) - dx, layout.y(160) - dy), layout.size(24), color=atlas.color)
+
+    def draw_vertical_speed_region(self, image, draw, layout: FCULayout, display: FCUDisplay, connected: bool, dx: int, dy: int):
+        if not connected:
+            return
+        self.value_atlas(layout.value_size).text(image, (layout.x(1700) - dx, layout.y(200) - dy), display.vertical_speed)  # should always be len=5 or 6
+        # little + or - in front of vertical speed
+        sign = self.value_atlas(layout.sign_size, font="Seven Segment")
+        sign.text(image, (layout.x(1650) - dx, layout.y(200 - 16) - dy), "-" if display.vertical_speed_negative else "+")
+
+    def get_image_for_icon_vertical_left(self, connected: bool, display: FCUDisplay):
+        """Speed, heading, QNH"""
+        self.inc("update")
+        layout = self.layout
+        image, draw = self.double_icon(width=layout.width, height=layout.height)
+
+        font = self.get_font(self._display_text.font, layout.text_size)
+        h = layout.inside + layout.text_size
+        centerx = image.width / 2
+        for i, txt in enumerate(["MACH" if display.mach else "SPD", "HDG" if display.heading_mode else "TRK", "QNH"]):
             draw.text(
-                (centerx, h),
-                text=qnh.replace("1", one),
+                (centerx, h + layout.y(i * ICON_SIZE)),
+                text=txt,
                 font=font,
-                anchor="mm",
+                anchor="ms",
                 align="center",
-                fill=self._display_value.color,
+                fill=self._display_text.color,
             )
 
+        if connected:
+            # values
+            atlas = self.value_atlas(layout.value_size)
+            dot_size = layout.size(10)
+            wdot = image.width - layout.inside - dot_size * 2
+
+            for h, value, managed in [
+                (layout.y(ICON_SIZE / 2), display.speed, display.speed_managed),
+                (layout.y(3 * ICON_SIZE / 2), display.heading, display.heading_managed),
+                (layout.y(5 * ICON_SIZE / 2), display.qnh, False),
+            ]:
+                atlas.text(image, (centerx, h), value, anchor="mm")
+                if managed:
+                    self.draw_managed_dot(draw, (wdot, h), dot_size)
+        else:
+            logger.debug("not connected")
+
         # Paste image on cockpit background and return it.
-        bg = self.button.deck.get_icon_background(
-            name=self.button_name,
-            width=THIS_WIDTH,
-            height=THIS_HEIGHT,
-            texture_in=None,
-            color_in="black",
-            use_texture=False,
-            who="FMA",
-        )
+        bg = self.get_background(layout=layout, color="black")
         bg.alpha_composite(image)
-        bg = self.button.deck.scale_icon_for_key(self.button.index, bg)
+        if not self.native:
+            bg = self.button.deck.scale_icon_for_key(self.button.index, bg)
         self._cached = bg
         return self._cached
 
-    def get_image_for_icon_vertical_right(self):
+    def get_image_for_icon_vertical_right(self, connected: bool, display: FCUDisplay):
         """Altitude, vs"""
         self.inc("update")
-        THIS_WIDTH = int(2 * ICON_SIZE / 3)
-        THIS_HEIGHT = 3 * ICON_SIZE
-        image, draw = self.double_icon(width=THIS_WIDTH, height=THIS_HEIGHT)
-
-        inside = round(0.04 * ICON_SIZE + 0.5)
-
-        heading_mode = self.button.get_simulator_variable_value("AirbusFBW/HDGTRKmode", default=1) == 0
+        layout = self.layout
+        image, draw = self.double_icon(width=layout.width, height=layout.height)
 
-        font = self.get_font(self._display_text.font, self._display_text.size)
-        h = inside + self._display_text.size
+        font = self.get_font(self._display_text.font, layout.text_size)
+        h = layout.inside + layout.text_size
         centerx = int(image.width / 2)
-        draw.text(
-            (centerx, h),
-            text="ALT",
-            font=font,
-            anchor="ms",
-            align="center",
-            fill=self._display_text.color,
-        )
-
-        txt = "V/S" if heading_mode else "FPA"
-        draw.text(
-            (centerx, h + ICON_SIZE),
-            text=txt,
-            font=font,
-            anchor="ms",
-            align="center",
-            fill=self._display_text.color,
-        )
-
-        # Nothing in lower third
-
-        if not self.button.sim.connected:
-            logger.debug("not connected")
-            bg = self.button.deck.get_icon_background(
-                name=self.button_name,
-                width=THIS_WIDTH,
-                height=THIS_HEIGHT,
-                texture_in=None,
-                color_in="black",
-                use_texture=False,
-                who="FMA",
-            )
-            bg.alpha_composite(image)
-            bg = self.button.deck.scale_icon_for_key(self.button.index, bg)
-            self._cached = bg
-            return self._cached
-
-        # values
-        text_size = int(2 * self._display_value.size / 3)
-        font = self.get_font(self._display_value.font, text_size)
-        one = " 1" if self._display_value.font == "Seven Segment" else "1"
-        dot_size = 10
-        wdot = image.width - inside - dot_size * 2
-
-        # ALTITUDE (always displayed)
-        alt_ft_val = self.button.get_simulator_variable_value("sim/cockpit2/autopilot/altitude_dial_ft", 26789)
-        alt_ft_val = int(round(alt_ft_val, 0))
-        alt = f"{alt_ft_val: 5d}"
-        h = ICON_SIZE / 2
-        draw.text(
-            (wdot - inside, h),
-            text=alt.replace("1", one),
-            font=font,
-            anchor="rm",
-            align="right",
-            fill=self._display_value.color,
-        )
-
-        alt_managed = self.button.get_simulator_variable_value("AirbusFBW/ALTmanaged", default=0) == 1
-        if alt_managed:
-            dot = ((wdot - dot_size, h - dot_size), (wdot + dot_size, h + dot_size))
-            draw.ellipse(dot, fill=self._display_value.color)
-
-        # Vertical speed/slope is tricky
-        vs_dashed = self.button.get_simulator_variable_value("AirbusFBW/VSdashed", False)
-        vs_val = -1
-        h = 3 * ICON_SIZE / 2
-        if alt_managed or vs_dashed:
-            vs = "----" if heading_mode else "-.---"
+        for i, txt in enumerate(["ALT", "V/S" if display.heading_mode else "FPA"]):
             draw.text(
-                (wdot - dot_size, h),
-                text=vs,
+                (centerx, h + layout.y(i * ICON_SIZE)),
+                text=txt,
                 font=font,
-                anchor="rm",
-                align="right",
-                fill=self._display_value.color,
+                anchor="ms",
+                align="center",
+                fill=self._display_text.color,
             )
+
+        # Nothing in lower third
+
+        if connected:
+            # values
+            atlas = self.value_atlas(layout.small_value_size)
+            dot_size = layout.size(10)
+            wdot = image.width - layout.inside - dot_size * 2
+
+            # ALTITUDE (always displayed)
+            h = layout.y(ICON_SIZE / 2)
+            atlas.text(image, (wdot - layout.inside, h), display.altitude, anchor="rm")
+            if display.altitude_managed:
+                self.draw_managed_dot(draw, (wdot, h), dot_size)
+
+            # VERTICAL SPEED, and little + or - in front of it
+            h = layout.y(3 * ICON_SIZE / 2)
+            atlas.text(image, (wdot - dot_size, h), display.vertical_speed, anchor="rm")
+            sign = self.value_atlas(layout.value_size, font="Seven Segment")
+            sign.text(image, (layout.inside, h), "-" if display.vertical_speed_negative else "+", anchor="lm")
         else:
-            vsdft = -1200 if heading_mode else -2.5
-            vs_val = self.button.get_simulator_variable_value("sim/cockpit/autopilot/vertical_velocity", default=vsdft)
-            vs_val_abs = abs(vs_val)
-            vs = ""
-            if heading_mode:  # V/S
-                vs_val_abs = abs(int(round(vs_val / 100, 0)))
-                vs = f"{vs_val_abs:02d}" + "oo"  # little zeros
-            else:  # FPA
-                vs_val_abs = abs(round(vs_val * 10) / 10)
-                vs = f"{vs_val_abs:3.1f}"
-            # print(">>>", vs_val, heading_mode, alt_managed, vs)
-            draw.text(
-                (wdot - dot_size, h),
-                text=vs.replace("1", one),
-                font=font,
-                anchor="rm",
-                align="right",
-                fill=self._display_value.color,
-            )
-        # little + or - in front of vertical speed
-        font = self.get_font("Seven Segment", int(self._display_value.size))
-        vs = "-" if vs_val < 0 else "+"
-        draw.text((inside, h), text=vs, font=font, anchor="lm", align="left", fill=self._display_value.color)  # should always be len=5 or 6
+            logger.debug("not connected")
 
         # Paste image on cockpit background and return it.
-        bg = self.button.deck.get_icon_background(
-            name=self.button_name,
-            width=THIS_WIDTH,
-            height=THIS_HEIGHT,
-            texture_in=None,
-            color_in="black",
-            use_texture=False,
-            who="FMA",
-        )
+        bg = self.get_background(layout=layout, color="black")
         bg.alpha_composite(image)
-        bg = self.button.deck.scale_icon_for_key(self.button.index, bg)
+        if not self.native:
+            bg = self.button.deck.scale_icon_for_key(self.button.index, bg)
         self._cached = bg
         return self._cached
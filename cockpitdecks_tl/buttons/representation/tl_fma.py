@@ -1,41 +1,18 @@
 import logging
-import re
+import threading
+import time
 
-from typing import Dict, Set
+from typing import Callable, Dict
+
+from PIL import Image
 
 from cockpitdecks.buttons.representation.draw import DrawBase, ICON_SIZE
 from cockpitdecks.strvar import TextWithVariables
 
+from .fma import FMA, FMA_COLUMNS, FMA_MATCHER, FMA_MESSAGE_LINES, FMA_UNKNOWN, COMBINED, WARNING, FMAGrid, FMASnapshot, get_fma_variables
+
 # ##############################
 # Toliss Airbus FMA display
-FMA_DATAREFS = {
-    "1w": "AirbusFBW/FMA1w",
-    "1g": "AirbusFBW/FMA1g",
-    "1b": "AirbusFBW/FMA1b",
-    "2w": "AirbusFBW/FMA2w",
-    "2b": "AirbusFBW/FMA2b",
-    "2m": "AirbusFBW/FMA2m",
-    "3w": "AirbusFBW/FMA3w",
-    "3b": "AirbusFBW/FMA3b",
-    "3a": "AirbusFBW/FMA3a",
-}
-FMA_BOXES = [
-    "AirbusFBW/FMAAPFDboxing",
-    "AirbusFBW/FMAAPLeftArmedBox",
-    "AirbusFBW/FMAAPLeftModeBox",
-    "AirbusFBW/FMAAPRightArmedBox",
-    "AirbusFBW/FMAAPRightModeBox",
-    "AirbusFBW/FMAATHRModeBox",
-    "AirbusFBW/FMAATHRboxing",
-    "AirbusFBW/FMATHRWarning",
-    "AirbusFBW/AutoBrkLo",
-    "AirbusFBW/AutoBrkMed",
-]
-FMA_A339_DATAREFS = [
-    #    "AirbusFBW/AltitudeTargetIsFL",
-    "toliss_airbus/init/cruise_alt",
-    "toliss_airbus/pfdoutputs/general/ap_altitude_reference",
-]
 # Reproduction on Streamdeck touchscreen colors is difficult.
 FMA_COLORS = {
     "b": "#00EEFF",
@@ -61,126 +38,143 @@ FMA_LABELS_ALT = {
     "AP": "Autopilot Mode",
 }
 
-# More or less ok for A320 series
-FMA_MESSAGES = [
-    "1TOGA",  # FMA 1 (THR)
-    "1FLX ([0-9]+) MCT",
-    "CLB",
-    "1IDLE ASYM",
-    "1A. FLOOR",
-    "1TOGA LK",
-    "1THR LK",
-    "1MAN TOGA",
-    "1MAN FLEX",
-    "1MAN MCT",
-    "1THR MCT",
-    "1THR CLB",
-    "1THR LVR",
-    "1THR SPEED",
-    "1THR IDLE",
-    "1THR DES",  # A339
-    "1SPEED",
-    "1MACH",
-    "1LVR CLB",
-    "1LVR MCT",
-    "1LVR ASYM",
-    "2SRS",  # FMA 2 (VNAV)
-    "2BRK LO",
-    "2BRK MED",
-    "2ALT",
-    "2ALT*",
-    "2ALT CRZ",
-    "2ALT CST",
-    "2V/S",
-    "2CLB",
-    "2DES",
-    "2OP CLB",
-    "2EXP CLB",
-    "2EXP DES",
-    "2OP DES",
-    "2G/S",
-    "2FINAL",
-    "2V/S ± ([0-9]+)",
-    "2FPA ± ([0-9]+).([0-9]+)",
-    "3RWY",  # FMA 3 (LNAV)
-    "3RWY TRK",
-    "3GA TRK",
-    "3TRACK",
-    "3HDG",
-    "3NAV",
-    "3LOC",
-    "3LOC*",
-    "3APP NAV",
-    "4CAT 1",  # FMA 4 (APPCH)
-    "4CAT 2",
-    "4CAT 3",
-    "4SINGLE",
-    "4CAT 3",
-    "4DUAL",
-    "4DH ([0-9]+)",
-    "4MDA ([0-9]+)",
-    "5AP 1",  # FMA 5 (MODE)
-    "5AP 2",
-    "5AP 1+2",
-    "5AP1",  # same, no space
-    "5AP2",
-    "5AP1+2",
-    "5-FD-",  # completely off
-    "51FD2",
-    "51FD",
-    "5FD2",
-    "51FD1",
-    "52FD2",
-    "52FD",
-    "5FD1",
-    "5A/THR",
-    "CLAND",  # COMBINED MODES
-    "CFLARE",
-    "CROLL",
-    "COUT",
-    "CFINAL",
-    "CAPP",
-    "MUSE MAN PITCH TRIM",  # FMA MESSAGES
-    "MMAN PITCH TRIM ONLY",
-    "MDECELERATE",
-    "MMORE DRAG",
-    "MVERTICAL DISCON AHEAD",
-    "MCHECK APP SEL",
-    "MSET GREEN DOT SPD",
-    "MSET HOLD SPEED",
-    "MMACH SEL .([0-9]+)",
-    "MSPEED SEL ([0-9]+)",
-]
-
 FMA_LABEL_MODE = 3  # 0 (None), 1 (keys), or 2 (values), or 3 alternates
 
 FMA_COUNT = len(FMA_LABELS.keys())
-FMA_LINES = len(set([c[0] for c in FMA_DATAREFS]))
-# FMA_COLUMNS = [[0, 7], [7, 15], [15, 21], [21, 28], [28, 37]]
-FMA_COLUMNS = [[0, 7], [7, 15], [15, 21], [21, 30], [30, 37]]
-FMA_LINE_LENGTH = FMA_COLUMNS[-1][-1]
-FMA_EMPTY_LINE = " " * FMA_LINE_LENGTH
-COMBINED = "combined"
-WARNING = "warn"
 
-GLOBAL_SUBSTITUTES = {"THRIDLE": "THR IDLE", "FNL": "FINAL", "1FD": "1 FD", "FD2": "FD 2"}
+FMA_BLINK_PERIOD = 1.0  # seconds, one on and one off phase
+FMA_WARNING_BLINKS = 5  # amber messages blink 5 times then stay fixed
+FMA_BOX_FLASH = 10.0  # seconds, new boxes flash after a mode change, 0 to disable
+BLINK_MESSAGE = "message"  # blinking element for amber texts, other elements are boxes
 
 logger = logging.getLogger(__file__)
 # logger.setLevel(logging.DEBUG)
 # logger.setLevel(15)
 
 
+class FMABlinkScheduler:
+    """Single thread calling blinking FMA back at each of their phase changes.
+
+    The thread runs while at least one element blinks.
+    Elements are added, removed, and expired under lock, so that a new element
+    never gets added to a thread that is about to exit.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.blinkers: set = set()
+        self._thread: threading.Thread | None = None
+        self._wakeup = threading.Event()
+
+    def schedule(self, blinker: "FMABlinker"):
+        """Must be called with lock held."""
+        self.blinkers.add(blinker)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="FMABlinker", daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def run(self):
+        while True:
+            changed = []
+            with self.lock:
+                now = time.monotonic()
+                delay = None
+                for blinker in list(self.blinkers):
+                    notify, wait = blinker.tick(now)
+                    if notify:
+                        changed.append(blinker)
+                    if wait is None:
+                        self.blinkers.discard(blinker)
+                    elif delay is None or wait < delay:
+                        delay = wait
+                if delay is None:
+                    self._thread = None
+                self._wakeup.clear()
+            for blinker in changed:
+                blinker.callback()
+            if delay is None:
+                logger.debug("nothing blinks")
+                return
+            self._wakeup.wait(delay)
+
+
+FMA_BLINK_SCHEDULER = FMABlinkScheduler()
+
+
+class FMABlinker:
+    """Blinking elements of one FMA.
+
+    All elements blink on a common clock, starting with the on phase.
+    Phase changes are driven by FMA_BLINK_SCHEDULER, which calls callback at each of them.
+    Elements in their off phase are returned by hidden().
+    """
+
+    def __init__(self, period: float, callback: Callable) -> None:
+        self.period = period
+        self.callback = callback
+        self.elements: Dict[str, float] = {}  # element: end of blink
+        self._epoch = 0.0
+        self._phase = 0
+
+    def start(self, element: str, duration: float):
+        with FMA_BLINK_SCHEDULER.lock:
+            now = time.monotonic()
+            if len(self.elements) == 0:
+                self._epoch = now
+                self._phase = 0
+            self.elements[element] = now + duration
+            FMA_BLINK_SCHEDULER.schedule(self)
+        logger.debug(f"{element} blinks for {duration} secs")
+
+    def stop(self, element: str):
+        with FMA_BLINK_SCHEDULER.lock:
+            self.elements.pop(element, None)
+
+    def is_on(self, now: float) -> bool:
+        return int((now - self._epoch) / (self.period / 2)) % 2 == 0
+
+    def hidden(self) -> frozenset:
+        """Elements currently in their off phase."""
+        now = time.monotonic()
+        if self.is_on(now):
+            return frozenset()
+        with FMA_BLINK_SCHEDULER.lock:
+            return frozenset([e for e, end in self.elements.items() if now < end])
+
+    def tick(self, now: float) -> tuple:
+        """Expires elements, called by scheduler with lock held.
+        Returns whether the display changed, and the delay to the next phase change, None if nothing blinks any more.
+        """
+        expired = [e for e, end in self.elements.items() if now >= end]
+        for element in expired:
+            del self.elements[element]
+        half = self.period / 2
+        phase = int((now - self._epoch) / half)
+        changed = phase != self._phase or len(expired) > 0
+        self._phase = phase
+        if len(self.elements) == 0:
+            return changed, None
+        return changed, half - ((now - self._epoch) % half)
+
+
 class FMAIcon(DrawBase):
     """Displays Toliss Airbus Flight Mode Annunciators on Streamdeck Plus touchscreen"""
 
     REPRESENTATION_NAME = "fma"
 
+    _chromes: Dict[tuple, Image.Image] = {}  # static layers, shared
+
     SCHEMA = {
         "text-font": {"type": "font", "meta": {"label": "Font"}},
         "text-size": {"type": "integer", "meta": {"label": "Size"}},
         "text-color": {"type": "color", "meta": {"label": "Color"}},
         "value-font": {"type": "font", "meta": {"label": "Font"}},
         "label-mode": {"type": "integer", "meta": {"label": "FMA Label mode"}},
+        "blink": {"type": "boolean", "meta": {"label": "Blink amber messages and new boxes"}},
+        "blink-period": {"type": "float", "meta": {"label": "Blink period (seconds)"}},
+        "warning-blinks": {"type": "integer", "meta": {"label": "Amber message blinks"}},
+        "box-flash": {"type": "float", "meta": {"label": "New box flash duration (seconds)"}},
     }
 
     def __init__(self, button: "Button"):
@@ -189,11 +183,21 @@ class FMAIcon(DrawBase):
         self.fmaconfig = button._config.get("fma", {})  # should not be none, empty at most...
         self.fma_label_mode = self.fmaconfig.get("label-mode", FMA_LABEL_MODE)
         self.icon_color = (20, 20, 20)
-        self.text = {k: FMA_EMPTY_LINE for k in FMA_DATAREFS}
-        self.previous_text: Dict[str, str] = {}
-        self.boxed: Set[str] = []
-        self._auto_brake = "00"
+        self.fma: FMA | None = None  # decoder, shared with other FMA on same simulator
+        self._snapshot: FMASnapshot | None = None  # last displayed
         self._cached = None  # cached icon
+        self._tiles: Dict[str, tuple] = {}  # all-in-one FMA tiles, slot: (content, image)
+        self._disconnected: tuple | None = None  # (chrome key, image) displayed when not connected
+        self._connected = False
+        self._frames: Dict[frozenset, Image.Image] = {}  # blink phase: image, for current content
+        self._hidden = frozenset()  # blinking elements currently off
+        self._grid: tuple | None = None  # (snapshot, grid), built on demand by make_lines()
+
+        self.blinker: FMABlinker | None = None
+        self.warning_blinks = int(self.fmaconfig.get("warning-blinks", FMA_WARNING_BLINKS))
+        self.box_flash = float(self.fmaconfig.get("box-flash", FMA_BOX_FLASH))
+        if self.fmaconfig.get("blink", True):
+            self.blinker = FMABlinker(period=float(self.fmaconfig.get("blink-period", FMA_BLINK_PERIOD)), callback=self.blink)
         self._datarefs: set | None = None
         self._icao = ""  # from which aircraft do we have the set?
 
@@ -216,220 +220,104 @@ class FMAIcon(DrawBase):
             fma = FMA_COUNT
         self.fma_idx = fma - 1
 
+        self.fma = FMA.get_hub(simulator=button.sim, icao=self.aircraft_icao)
+        self.fma.register(self)
+        self.fma.set_icao(self.aircraft_icao)
+
     @property
     def aircraft_icao(self):
         return self.button.cockpit.get_aircraft_icao()
 
+    @property
+    def text(self) -> dict:
+        return self._snapshot.texts if self._snapshot is not None else {}
+
+    @property
+    def boxed(self) -> frozenset:
+        return self._snapshot.boxed if self._snapshot is not None else frozenset()
+
     @property
     def combined(self) -> bool:
         """FMA vertical and lateral combined into one"""
         return COMBINED in self.boxed
 
     def describe(self) -> str:
+        FMA_UNKNOWN.dump()  # unknown annunciations collected so far, in the log
         return "The representation is specific to Toliss Airbus and display the Flight Mode Annunciators (FMA)."
 
     def get_variables(self) -> set:
-        if self._datarefs is not None:
+        if self._datarefs is not None and self._icao == self.aircraft_icao:
             return self._datarefs
 
-        self._datarefs = set(FMA_BOXES) | set(FMA_DATAREFS.values())
-        if self.aircraft_icao == "A339":
-            self._datarefs = self._datarefs | set(FMA_A339_DATAREFS)
+        self._datarefs = get_fma_variables(self.aircraft_icao)
         self._icao = self.aircraft_icao
         return self._datarefs
 
-    def is_master_fma(self) -> bool:
-        return self.all_in_one or self.fma_idx == 1
-
-    def get_master_fma(self):
-        """Among all FMA icon buttons on the same page, tries to find the master one,
-        i;e. the one that holds the datarefs.
+    def fma_changed(self, snapshot: FMASnapshot, columns: set):
+        """Called by the FMA decoder with the columns that changed.
+        Nothing to record, is_updated() compares the displayed columns of snapshots, whatever thread renders.
         """
-        if self.is_master_fma():
-            return self
-        candidates = list(
-            filter(
-                lambda m: isinstance(m._representation, FMAIcon) and m._representation.is_master_fma(),
-                self.button.page.buttons.values(),
-            )
-        )
-        if len(candidates) == 1:
-            logger.debug(f"button {self.button.name}: master FMA is {candidates[0].name}, fma={candidates[0]._representation.fma_idx}")
-            return candidates[0]._representation
-        if len(candidates) == 0:
-            logger.warning(f"button {self.button.name}: no master FMA found")
-        else:
-            logger.warning(f"button {self.button.name}: too many master FMA")
-        return None
+        logger.debug(f"button {self.button.name}: FMA columns {columns} changed")
 
     def is_updated(self) -> bool:
-        oldboxed = self.boxed
-        self.check_boxed()
-        if self.boxed != oldboxed:
-            logger.debug(f"boxed changed {self.boxed}/{oldboxed}")
-            return True
-        auto_brake = self.auto_brake()
-        if self._auto_brake != auto_brake:
-            logger.debug(f"auto_brake changed {self._auto_brake}/{auto_brake}")
-            self._auto_brake = auto_brake
-            return True
-        self.previous_text = self.text
-        self.text = {k: self.button.get_simulator_variable_value(v, default=FMA_EMPTY_LINE) for k, v in FMA_DATAREFS.items()}
-        return self.text != self.previous_text
+        self.fma.set_icao(self.aircraft_icao)  # aircraft may have changed
+        snapshot = self.fma.snapshot  # decodes and notifies if necessary
+        previous = self._snapshot
+        updated = previous is None
+        if snapshot is not previous:
+            if previous is not None:
+                self.check_blink(previous=previous, snapshot=snapshot)
+                columns = range(FMA_COUNT) if self.all_in_one else [self.fma_idx]
+                updated = any([previous.column_state(idx) != snapshot.column_state(idx) for idx in columns])
+            self._snapshot = snapshot
+        if updated:
+            self._frames = {}
+        hidden = self.blinker.hidden() if self.blinker is not None else frozenset()
+        if hidden != self._hidden:
+            self._hidden = hidden
+            updated = True
+        if not updated:
+            return False
+        logger.debug(f"button {self.button.name}: FMA changed")
+        return True
+
+    def check_blink(self, previous: FMASnapshot, snapshot: FMASnapshot):
+        """Starts blinking new amber texts and new boxes of the columns displayed by this FMA."""
+        if self.blinker is None:
+            return
+        columns = range(FMA_COUNT) if self.all_in_one else [self.fma_idx]
+
+        def amber(s: FMASnapshot) -> frozenset:
+            return frozenset([t for idx in columns for t in s.columns[idx] if t[1] == "a"])
+
+        texts = amber(snapshot)
+        if len(texts - amber(previous)) > 0:
+            self.blinker.start(BLINK_MESSAGE, duration=self.warning_blinks * self.blinker.period)
+        elif len(texts) == 0:
+            self.blinker.stop(BLINK_MESSAGE)
+
+        refs = set([str(idx + 1) for idx in columns])
+        if self.box_flash > 0:
+            for ref in snapshot.boxed - previous.boxed:
+                if ref[0] in refs:
+                    self.blinker.start(ref, duration=self.box_flash)
+        for ref in previous.boxed - snapshot.boxed:
+            self.blinker.stop(ref)
+
+    def blink(self):
+        """Called by blinker at each phase change."""
+        self.button.render()
 
     def is_fma_message(self, message: str, column: int = 0) -> bool:
-        # search with column
-        message = message.strip()
-        test = message
-        if 1 <= column <= 5:  # annunciators 1-5
-            test = f"{column}{message}"
-        elif column == 6:  # combined
-            test = f"C{message}"
-        elif column == 7:  # messages
-            test = f"M{message}"
-        if test in FMA_MESSAGES:
-            logger.debug(f"found {test}")
-            return True
-        # search making abstraction of spaces, sometimes AP1 is "AP 1".
-        # Note: in this case, the vesrion to display might be nicer with space around...
-        for m in FMA_MESSAGES:
-            if test.replace(" ", "") == m.replace(" ", ""):
-                logger.debug(f"found {test} (no space)")
-                return True
-        # search without column
-        msgs = [m[1:] for m in FMA_MESSAGES]
-        if message in msgs:
-            logger.debug(f"found {message} ({column})")
-            return True
-        for test in filter(lambda m: "(" in m, FMA_MESSAGES):
-            pattern = re.compile(test)
-            if pattern.match(message):
-                logger.debug(f"{message} matches {test}")
-                return True
-        logger.debug(f"{message} ({column}) not in FMA message list")
-        return False
-
-    def check_boxed(self):
-        """Check "boxed" datarefs to determine which texts are boxed/framed.
-        They are listed as FMA#-LINE# pairs of digit. Special keyword WARNING if warning enabled.
-        """
-        boxed = []
-        if self.button.get_simulator_variable_value("AirbusFBW/FMAAPLeftArmedBox") == 1:
-            boxed.append("22")
-        if self.button.get_simulator_variable_value("AirbusFBW/FMAAPLeftModeBox") == 1:
-            boxed.append("21")
-        if self.button.get_simulator_variable_value("AirbusFBW/FMAAPRightArmedBox") == 1:
-            boxed.append("32")
-        if self.button.get_simulator_variable_value("AirbusFBW/FMAAPRightModeBox") == 1:
-            boxed.append("31")
-        if self.button.get_simulator_variable_value("AirbusFBW/FMAATHRModeBox") == 1:
-            boxed.append("11")
-        if self.button.get_simulator_variable_value("AirbusFBW/FMAATHRboxing") == 1:
-            boxed.append("12")
-        if self.button.get_simulator_variable_value("AirbusFBW/FMAATHRboxing") == 2:
-            boxed.append("11")
-            boxed.append("12")
-        if self.button.get_simulator_variable_value("AirbusFBW/FMATHRWarning") == 1:
-            boxed.append(WARNING)
-        # big mess:
-        boxcode = self.button.get_simulator_variable_value("AirbusFBW/FMAAPFDboxing")
-        if boxcode is not None:  # can be 0-7, is it a set of binary flags?
-            boxcode = int(boxcode)
-            if boxcode & 1 == 1:
-                boxed.append("51")
-            if boxcode & 2 == 2:
-                boxed.append("52")
-            if boxcode & 4 == 4:
-                boxed.append("53")
-            if boxcode & 8 == 8:
-                boxed.append(COMBINED)
-            if boxcode & 9 == 9:
-                boxed.append("21")
-            # etc.
-        self.boxed = set(boxed)
-        logger.debug(f"boxed: {boxcode}, {self.boxed}")
-
-    def auto_brake(self):
-        auto_brake = "00"
-        if self.aircraft_icao != "A339":
-            return auto_brake
-        brk_lo = self.button.get_simulator_variable_value("AirbusFBW/AutoBrkLo", default=-1)
-        if brk_lo == 1:
-            auto_brake = "10"
-        else:
-            brk_md = self.button.get_simulator_variable_value("AirbusFBW/AutoBrkMed", default=-1)
-            if brk_md == 1:
-                auto_brake = "01"
-        return auto_brake
-
-    def adjust_fma_texts(self):
-        if self.aircraft_icao != "A339":
-            return
-        # 1
-        init_alt = self.button.get_simulator_variable_value("toliss_airbus/init/cruise_alt", default=-1)
-        fcu_alt = self.button.get_simulator_variable_value("toliss_airbus/pfdoutputs/general/ap_altitude_reference", default=-2)
-        if init_alt == fcu_alt:
-            for line in ["1w", "2b"]:
-                text = self.text.get(line, "")
-                before = text
-                if text.strip() == "ALT":
-                    text = text.replace("ALT    ", "ALT CRZ")
-                    self.text[line] = text
-                    logger.debug(f"fma text modified: {line}: {before} -> {text}")
-        # 2
-        auto_brake = self.auto_brake()
-        if auto_brake == "10":
-            self.text["2b"] = "BRK LO"
-        elif auto_brake == "01":
-            self.text["2b"] = "BRK MED"
-        self.text["2b"] = self.text["2b"] + " " * (FMA_LINE_LENGTH - len(self.text["2b"]))
-
-    def get_fma_lines(self, idx: int = -1):
-        if not self.is_master_fma():
-            master_fma = self.get_master_fma()
-            if master_fma is not None:
-                return master_fma.get_fma_lines(idx=self.fma_idx)
-            logger.warning(f"button {self.button.name}: fma has no master, no lines")
-            return []
+        return FMA_MATCHER.is_fma_message(message, column)
 
+    def get_fma_lines(self, idx: int = -1) -> frozenset:
+        """Texts of FMA column idx in last snapshot fetched by is_updated()."""
         if idx == -1:
             idx = self.fma_idx
-        s = FMA_COLUMNS[idx][0]  # idx * self.text_length
-        e = FMA_COLUMNS[idx][1]  # s + self.text_length
-        l = e - s
-        c = "1w"
-        empty = c + " " * l
-        if self.combined and idx == 1:
-            s = FMA_COLUMNS[idx][0]
-            e = FMA_COLUMNS[idx + 1][1]
-            l = e - s
-            c = "1w"
-            empty = c + " " * l
-        elif self.combined and idx == 2:
-            return set()
-        lines = []
-        for li in range(1, 4):  # Loop on lines
-            good = empty
-            for k, v in self.text.items():
-                raws = {k: v for k, v in self.text.items() if int(k[0]) == li}
-                for k, v in raws.items():
-                    if type(v) is float:
-                        # logger.warning(f"{k}={v} is float ({raws})")
-                        continue
-                    # normalize
-                    if len(v) < FMA_LINE_LENGTH:
-                        v = v + " " * (FMA_LINE_LENGTH - len(v))
-                    if len(v) > FMA_LINE_LENGTH:
-                        v = v[:FMA_LINE_LENGTH]
-                    # extract
-                    m = v[s:e]
-                    if len(m) != l:
-                        logger.warning(f"string '{m}' len {len(m)} has wrong size (should be {l})")
-                    if (c + m) != empty:  # if good == empty and
-                        good = str(li) + k[1] + m
-                        lines.append(good)
-        self.adjust_fma_texts()
-        return set(lines)
+        if self._snapshot is None:
+            return frozenset()
+        return self._snapshot.columns[idx]
 
     def get_image_for_icon_alt(self):
         """
@@ -438,6 +326,11 @@ class FMAIcon(DrawBase):
         if not self.is_updated() and self._cached is not None:
             return self._cached
 
+        frame = self._frames.get(self._hidden)
+        if frame is not None:  # already rendered for this blink phase
+            self._cached = frame
+            return self._cached
+
         image, draw = self.double_icon(width=ICON_SIZE, height=ICON_SIZE)  # annunciator text and leds , color=(0, 0, 0, 0)
         inside = round(0.04 * image.width + 0.5)
 
@@ -461,9 +354,10 @@ class FMAIcon(DrawBase):
                 h = image.height - inside - self._text.size
             # logger.debug(f"position {(w, h)}")
             color = FMA_COLORS[text[1]]
-            draw.text((w, h), text=text[2:], font=font, anchor=p + "m", align=a, fill=color)
+            if text[1] != "a" or BLINK_MESSAGE not in self._hidden:
+                draw.text((w, h), text=text[2:], font=font, anchor=p + "m", align=a, fill=color)
             ref = f"{self.fma_idx+1}{idx+1}"
-            if ref in self.boxed:
+            if ref in self.boxed and ref not in self._hidden:
                 draw.rectangle(
                     (
                         2 * inside,
@@ -487,6 +381,7 @@ class FMAIcon(DrawBase):
         )
         bg.alpha_composite(image)
         self._cached = bg
+        self._frames[self._hidden] = bg
         return self._cached
 
     def get_image_for_icon(self):
@@ -495,41 +390,95 @@ class FMAIcon(DrawBase):
         Label may be updated at each activation since it can contain datarefs.
         Also add a little marker on placeholder/invalid buttons that will do nothing.
         (This is currently more or less hardcoded for Elgato Streamdeck Plus touchscreen.)
+
+        Each FMA column is drawn on its own tile, tiles are only redrawn when their content changed.
         """
         if not self.all_in_one:
             return self.get_image_for_icon_alt()
 
-        if not self.is_updated() and self._cached is not None:
+        connected = self.button.sim.connected
+        if not self.is_updated() and self._cached is not None and connected == self._connected:
             logger.debug(f"button {self.button.name}: returning cached")
             return self._cached
+        self._connected = connected
 
-        # print(">>>" + "0" * 10 + "1" * 10 + "2" * 10 + "3" * 10)
-        # print(">>>" + "0123456789" * 4)
-        # print("\n".join([f"{k}:{v}:{len(v)}" for k, v in self.text.items()]))
-        # print(">>>" + "0123456789" * 4)
+        icon_width = int(8 * ICON_SIZE / 5)
 
-        image, draw = self.double_icon(width=8 * ICON_SIZE, height=ICON_SIZE)
+        if not connected:
+            logger.debug("not connected")
+            key = self.chrome_key() + (self.icon_color,)
+            if self._disconnected is None or self._disconnected[0] != key:
+                bg = self.button.deck.get_icon_background(
+                    name=self.button_name,
+                    width=8 * ICON_SIZE,
+                    height=ICON_SIZE,
+                    texture_in=None,
+                    color_in=self.icon_color,
+                    use_texture=False,
+                    who="FMA",
+                )
+                bg.alpha_composite(self.get_chrome())
+                self._disconnected = (key, bg)
+            self._cached = self._disconnected[1]
+            return self._cached
 
-        inside = round(0.04 * image.height + 0.5)
+        frame = self._frames.get(self._hidden)
+        if frame is not None:  # already rendered for this blink phase
+            self._cached = frame
+            return self._cached
 
-        # pylint: disable=W0612
-        logger.debug(f"button {self.button.name}: is FMA master")
+        image = self.get_chrome().copy()
+        for i in range(FMA_COUNT):
+            if i == 2 and self.combined:  # skip it
+                continue
+            image.alpha_composite(self.get_fma_tile(idx=i), dest=(i * icon_width, 0))
+        image.alpha_composite(self.get_message_tile(), dest=(icon_width, 0))
+
+        # Paste image on cockpit background and return it.
+        bg = self.button.deck.get_icon_background(
+            name=self.button_name,
+            width=8 * ICON_SIZE,
+            height=ICON_SIZE,
+            texture_in=None,
+            color_in=self.icon_color,
+            use_texture=False,
+            who="FMA",
+        )
+        bg.alpha_composite(image)
+        self._cached = bg
+        self._frames[self._hidden] = bg
+        logger.debug("texts updated")
+
+        # with open("fma_lines.png", "wb") as im:
+        #     image.save(im, format="PNG")
+        #     logger.debug(f"button {self.button.name}: saved")
 
-        # replaces a few bizarre strings...
-        text = self.fmaconfig.get("text")
-        if text is not None:
-            text = text.replace("THRIDLE", "THR IDLE")  # ?
-            text = text.replace("FNL", "FINAL")  # ?
+        return self._cached
+
+    def chrome_key(self) -> tuple:
+        return (self.fma_label_mode, self._text.font, 8 * ICON_SIZE, ICON_SIZE, self.combined)
+
+    def get_chrome(self):
+        """Returns the static part of the all-in-one FMA: column separators and labels.
+        One image is kept per label mode, font, size and combined mode, and shared between FMA.
+        """
+        key = self.chrome_key()
+        chrome = FMAIcon._chromes.get(key)
+        if chrome is not None:
+            return chrome
 
+        image, draw = self.double_icon(width=8 * ICON_SIZE, height=ICON_SIZE)
+        inside = round(0.04 * image.height + 0.5)
         icon_width = int(8 * ICON_SIZE / 5)
         loffset = 0
         lthinkness = 3
-        has_line = False
         for i in range(FMA_COUNT - 1):
             loffset = loffset + icon_width
-            if i == 1:  # second line skipped
+            if i == 1:  # second line skipped, see below and get_message_tile()
                 continue
             draw.line(((loffset, 0), (loffset, ICON_SIZE)), fill="white", width=lthinkness)
+        if not self.combined:  # upper part of second line, always present if not combined
+            draw.line(((2 * icon_width, 0), (2 * icon_width, int(2 * ICON_SIZE / 3))), fill="white", width=lthinkness)
         if self.fma_label_mode > 0:
             ls = 20
             font = self.get_font(self._text.font, ls)
@@ -550,190 +499,123 @@ class FMAIcon(DrawBase):
                     fill="white",
                 )
                 offs = offs + icon_width
+        FMAIcon._chromes[key] = image
+        return image
 
-        if not self.button.sim.connected:
-            logger.debug("not connected")
-            if not self.combined:
-                draw.line(
-                    ((2 * icon_width, 0), (2 * icon_width, int(2 * ICON_SIZE / 3))),
-                    fill="white",
-                    width=lthinkness,
-                )
-            bg = self.button.deck.get_icon_background(
-                name=self.button_name,
-                width=8 * ICON_SIZE,
-                height=ICON_SIZE,
-                texture_in=None,
-                color_in=self.icon_color,
-                use_texture=False,
-                who="FMA",
-            )
-            bg.alpha_composite(image)
-            self._cached = bg
-            self.previous_text = self.text
-            logger.debug("texts updated")
-            return self._cached
-
-        loffset = 0
-        for i in range(FMA_COUNT):
-            if i == 2 and self.combined:  # skip it
-                loffset = loffset + icon_width
+    def get_fma_tile(self, idx: int):
+        """Returns the tile of FMA column idx, all-in-one FMA.
+        When modes are combined, the tile of column 2 spans columns 2 and 3.
+        Tile is only redrawn if its texts or boxes changed.
+        """
+        span = idx == 1 and self.combined
+        lines = self.get_fma_lines(idx=idx)
+        if idx in [1, 2]:  # warning messages are drawn across columns 2-3, see get_message_tile()
+            lines = frozenset([t for t in lines if t[:2] not in FMA_MESSAGE_LINES])
+        boxes = frozenset([b for b in self.boxed if b[0] == str(idx + 1)])
+        warning = WARNING in self.boxed
+        hidden = self._hidden & (boxes | {BLINK_MESSAGE})
+
+        slot = "span" if span else str(idx)
+        key = (lines, boxes, warning, hidden)
+        cached = self._tiles.get(slot)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        logger.debug(f"button {self.button.name}: FMA {idx+1}: {lines}")
+        icon_width = int(8 * ICON_SIZE / 5)
+        tile, draw = self.double_icon(width=2 * icon_width if span else icon_width, height=ICON_SIZE)
+        inside = round(0.04 * ICON_SIZE + 0.5)
+        font = self.get_font(self._text.font, self._text.size)
+        lat = int(4 * ICON_SIZE / 5)
+        if span:
+            lat = 2 * lat
+        for text in lines:
+            line = int(text[0]) - 1
+            h = ICON_SIZE / 2
+            if line == 0:
+                h = inside + self._text.size / 2
+            elif line == 2:
+                h = ICON_SIZE - inside - self._text.size / 2
+            color = FMA_COLORS[text[1]]
+            display, known = FMA_MATCHER.match(text[2:], idx + 1)
+            if text[1] != "a" or BLINK_MESSAGE not in hidden:
+                draw.text((lat, h), text=display, font=font, anchor="mm", align="center", fill=color)
+            ref = f"{idx+1}{line+1}"
+            if ref in boxes and ref not in hidden:
+                color = "orange" if warning else "white"
+                if ref == "21" and span:  # frame around combined text (LAND, FLARE, ROLL OUT...)
+                    draw.rectangle(
+                        (
+                            int(icon_width / 4 + 2 * inside),
+                            h - self._text.size / 2,
+                            int(icon_width + 3 * icon_width / 4 - 2 * inside),
+                            h + self._text.size / 2 + 4,
+                        ),
+                        outline=color,
+                        width=3,
+                    )
+                else:
+                    draw.rectangle(
+                        (
+                            2 * inside,
+                            h - self._text.size / 2,
+                            icon_width - 2 * inside,
+                            h + self._text.size / 2 + 4,
+                        ),
+                        outline=color,
+                        width=3,
+                    )
+        self._tiles[slot] = (key, tile)
+        return tile
+
+    def get_message_tile(self):
+        """Returns the tile with warning messages and separator between columns 2 and 3, all-in-one FMA.
+        Tile spans columns 2 and 3.
+        """
+        #
+        # special treatment of warning amber messages, centered across FMA 2-3, 3rd line, amber
+        # (they blink 5 times then stay fixed, see FMABlinker.)
+        #
+        s = FMA_COLUMNS[1][0]
+        e = FMA_COLUMNS[2][1]
+        messages = []
+        for idx in [1, 2]:
+            if idx == 2 and self.combined:
                 continue
-            lines = self.get_fma_lines(idx=i)
-            logger.debug(f"button {self.button.name}: FMA {i+1}: {lines}")
+            for text in self.get_fma_lines(idx=idx):
+                currline = text[:2]
+                if currline in FMA_MESSAGE_LINES:
+                    messages.append((idx, currline, self.text[currline][s:e].strip()))
+        hidden = BLINK_MESSAGE in self._hidden
+        key = (self.combined, frozenset(messages), hidden)
+        cached = self._tiles.get("message")
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        icon_width = int(8 * ICON_SIZE / 5)
+        tile, draw = self.double_icon(width=2 * icon_width, height=ICON_SIZE)
+        inside = round(0.04 * ICON_SIZE + 0.5)
+        lthinkness = 3
+        if len(messages) > 0:
             font = self.get_font(self._text.font, self._text.size)
-            w = int(4 * ICON_SIZE / 5)
-            p = "m"
-            a = "center"
-            idx = -1
-            for text in lines:
-                idx = int(text[0]) - 1  # idx + 1
-                if text[2:] == (" " * (len(text) - 2)):
+            h = ICON_SIZE - inside - self._text.size / 2
+            if self.combined:  # upper part of line is in chrome if not combined
+                draw.line(((icon_width, 0), (icon_width, int(2 * ICON_SIZE / 3))), fill="white", width=lthinkness)
+            for idx, currline, wmsg in messages:
+                logger.debug(f"{'combined ' if idx == 1 else ''}message '{wmsg}'")
+                if currline[1] == "a" and hidden:
                     continue
-                h = image.height / 2
-                if idx == 0:
-                    h = inside + self._text.size / 2
-                elif idx == 2:
-                    h = image.height - inside - self._text.size / 2
-                    #
-                    # special treatment of warning amber messages, centered across FMA 2-3, 3rd line, amber
-                    # (yes, I know, they blink 5 times then stay fixed. may be one day.)
-                    #
-                    currline = text[:2]
-                    if (i == 1 or i == 2) and currline in ["3a", "3w"]:
-                        wmsg = self.text[currline][FMA_COLUMNS[1][0] : FMA_COLUMNS[2][1]].strip()
-                        if i == 1:
-                            if not self.is_fma_message(wmsg, 6):
-                                logger.warning(f">>{self.text[currline]}")
-
-                            logger.debug(f"combined message '{wmsg}'")
-                        else:
-                            if not self.is_fma_message(wmsg, 7):
-                                logger.warning(f">>{self.text[currline]}")
-                            logger.debug(f"message '{wmsg}'")
-                        draw.line(
-                            (
-                                (2 * icon_width, 0),
-                                (2 * icon_width, int(2 * ICON_SIZE / 3)),
-                            ),
-                            fill="white",
-                            width=lthinkness,
-                        )
-                        draw.text(
-                            (2 * icon_width, h),
-                            text=wmsg,
-                            font=font,
-                            anchor=p + "m",
-                            align=a,
-                            fill=FMA_COLORS[text[1]],
-                        )
-                        has_line = True
-                        continue
-                    #
-                    #
-                color = FMA_COLORS[text[1]]
-                # logger.debug(f"added {text[2:]} @ {loffset + w}, {h}, {color}")
-                lat = loffset + w
-                if i == 1 and self.combined:
-                    lat = lat + w
-                if not self.is_fma_message(text[2:], i + 1):
-                    logger.warning(f">>{text}")
-
-                for k, v in GLOBAL_SUBSTITUTES.items():
-                    text = text.replace(k, v)
-
-                draw.text(
-                    (lat, h),
-                    text=text[2:],
-                    font=font,
-                    anchor=p + "m",
-                    align=a,
-                    fill=color,
-                )
-                ref = f"{i+1}{idx+1}"
-                # logger.debug(ref, text)
-                if ref in self.boxed:
-                    if WARNING in self.boxed:
-                        color = "orange"
-                    else:
-                        color = "white"
-                    if ref == "21" and self.combined:  # frame around combined text (LAND, FLARE, ROLL OUT...)
-                        draw.rectangle(
-                            (
-                                int(loffset + icon_width / 4 + 2 * inside),
-                                h - self._text.size / 2,
-                                int(loffset + icon_width + 3 * icon_width / 4 - 2 * inside),
-                                h + self._text.size / 2 + 4,
-                            ),
-                            outline=color,
-                            width=3,
-                        )
-                    else:
-                        draw.rectangle(
-                            (
-                                loffset + 2 * inside,
-                                h - self._text.size / 2,
-                                loffset + icon_width - 2 * inside,
-                                h + self._text.size / 2 + 4,
-                            ),
-                            outline=color,
-                            width=3,
-                        )
-            loffset = loffset + icon_width
-
-        if not has_line and not self.combined:
-            draw.line(
-                ((2 * icon_width, 0), (2 * icon_width, ICON_SIZE)),
-                fill="white",
-                width=lthinkness,
-            )
-
-        # Paste image on cockpit background and return it.
-        bg = self.button.deck.get_icon_background(
-            name=self.button_name,
-            width=8 * ICON_SIZE,
-            height=ICON_SIZE,
-            texture_in=None,
-            color_in=self.icon_color,
-            use_texture=False,
-            who="FMA",
-        )
-        bg.alpha_composite(image)
-        self._cached = bg
-        self.previous_text = self.text
-        logger.debug("texts updated")
-
-        # with open("fma_lines.png", "wb") as im:
-        #     image.save(im, format="PNG")
-        #     logger.debug(f"button {self.button.name}: saved")
-
-        return self._cached
+                draw.text((icon_width, h), text=wmsg, font=font, anchor="mm", align="center", fill=FMA_COLORS[currline[1]])
+        elif not self.combined:  # lower part of line
+            draw.line(((icon_width, int(2 * ICON_SIZE / 3)), (icon_width, ICON_SIZE)), fill="white", width=lthinkness)
+        self._tiles["message"] = (key, tile)
+        return tile
 
     def make_lines(self) -> list:
         """Returns array of lines, each line is array of tuple (character, color).
         [[("a", "g"), ("b", "w"), ...], [...]]
         """
-        all_lines = []
-        for linenum in range(3):
-            line = {k: v for k, v in self.text.items() if int(k[0]) == (linenum + 1)}
-            thisline = []
-            for i in range(FMA_LINE_LENGTH):
-                car = None
-                color = None
-                carline = None
-                for k, l in line.items():
-                    l = l.ljust(FMA_LINE_LENGTH)
-                    c = l[i]
-                    if c != " ":
-                        if car is not None and car != " ":
-                            logger.warning(f"several lines with different characters ({i}, {car}, {color} vs {c} {k[1]}) / {carline} {l}")
-                        else:
-                            car = c
-                            color = k[1]
-                            carline = l
-                    else:
-                        if car is None:
-                            car = c
-                thisline.append((car, color))
-            all_lines.append(thisline)
-        return all_lines
+        snapshot = self.fma.snapshot
+        if self._grid is None or self._grid[0] is not snapshot:
+            self._grid = (snapshot, FMAGrid.from_texts(snapshot.texts))
+        return self._grid[1].as_lines()
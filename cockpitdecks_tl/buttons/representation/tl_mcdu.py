@@ -2,7 +2,7 @@ import logging
 
 from cockpitdecks.buttons.representation.hardware import HardwareRepresentation
 
-from .mcdu import MCDU
+from .mcdu import MCDU, MCDU_COALESCE_WINDOW, MCDU_COLORS, MCDU_ROWS, MCDUGlyphAtlas, MCDUSnapshot
 
 logger = logging.getLogger(__file__)
 # logger.setLevel(logging.DEBUG)
@@ -14,7 +14,7 @@ class MCDUScreen(HardwareRepresentation):
 
     REPRESENTATION_NAME = "mcdu"
 
-    SCHEMA = HardwareRepresentation.SCHEMA | {"unit": {"type": "integer"}}
+    SCHEMA = HardwareRepresentation.SCHEMA | {"unit": {"type": "integer"}, "coalesce": {"type": "float"}}
 
     def __init__(self, button: "Button"):
         self._inited = False
@@ -26,14 +26,17 @@ class MCDUScreen(HardwareRepresentation):
         self.altfontsm = None
         self.side_margin = None
         self.linebases = []
+        self.atlas = None
+        self._rows: list = [None] * MCDU_ROWS  # ((version, missing), tile) of each row
+        self._ready = None  # some data received
 
         HardwareRepresentation.__init__(self, button=button)
 
         self.mcduconfig = button._config.get("mcdu", {})  # should not be none, empty at most...
         self.mcdu_unit = self.mcduconfig.get("unit", 1)
         self._datarefs = None
-        self.mcdu = MCDU()
-        self.mcdu.init(simulator=button.sim)
+        self.mcdu = MCDU.get_hub(simulator=button.sim, window=self.mcduconfig.get("coalesce", MCDU_COALESCE_WINDOW))
+        self.mcdu.register(self)
 
     def init(self):
         super().init()
@@ -62,6 +65,7 @@ class MCDUScreen(HardwareRepresentation):
         # alternate font for special character, not present in above (arrows, brackets, etc.)
         self.altfont = self.get_font("D-DIN.otf", self.font_lg)
         self.altfontsm = self.get_font("D-DIN.otf", self.font_sm)
+        self.atlas = MCDUGlyphAtlas(fonts=[self.fontsm, self.font, self.altfontsm, self.altfont], char_delta=self.xd)
 
         self._inited = True
 
@@ -69,24 +73,63 @@ class MCDUScreen(HardwareRepresentation):
         return "The representation is specific to Toliss Airbus and display the MCDU screen."
 
     def get_variables(self) -> set:
-        return self.mcdu.get_variables()
+        # Listed so that the simulator monitors them, redraws are limited to changed rows (see is_updated()).
+        return self.mcdu.get_unit_variables(self.mcdu_unit)
+
+    def mcdu_changed(self, mcdu_unit: int, lines: set):
+        """Called by the MCDU after a burst of changes has been applied."""
+        if mcdu_unit == self.mcdu_unit:
+            self.button.render()
 
     def is_updated(self) -> bool:
-        return True
+        if (self.mcdu.readiness(self.mcdu_unit) > 0.0) != self._ready:
+            return True
+        snapshot = self.mcdu.snapshot
+        for row in range(MCDU_ROWS):
+            if self._rows[row] is None or self._rows[row][0] != self.row_state(row, snapshot):
+                return True
+        return False
+
+    def get_frame(self, since: int | None = None) -> bytes:
+        """Character grid of the MCDU unit as a compact binary frame, for clients that draw the MCDU themselves."""
+        return self.mcdu.get_frame(mcdu_unit=self.mcdu_unit, since=since)
+
+    def row_state(self, row: int, snapshot: MCDUSnapshot) -> tuple:
+        return snapshot.row_version(mcdu_unit=self.mcdu_unit, row=row), snapshot.row_missing(mcdu_unit=self.mcdu_unit, row=row)
+
+    def get_row_tile(self, row: int, snapshot: MCDUSnapshot):
+        """Returns the image of row, rasterised again only if its content or completeness changed.
+        Tiles span the whole width, the row baseline is font_lg pixels below the top of the tile.
+        Rows with data not received yet are marked with an amber bar in the left margin.
+        """
+        state = self.row_state(row, snapshot)
+        if self._rows[row] is not None and self._rows[row][0] == state:
+            return self._rows[row][1]
+        tile, draw = self.double_icon(width=self.sizes[0], height=self.font_lg + int(self.font_lg / 2))
+        self.mcdu.draw_line(
+            image=tile,
+            line=snapshot.get_display_row(mcdu_unit=self.mcdu_unit, row=row),
+            y=self.font_lg,
+            atlas=self.atlas,
+            left_offset=self.side_margin + self.xd,  # int(self.xd / 2),
+        )
+        if state[1]:
+            left = int(self.side_margin / 4)  # cells start half a cell after the side margin, the left margin is free
+            draw.rectangle(((left, int(self.font_lg / 2)), (left + int(self.side_margin / 2), self.font_lg)), fill=MCDU_COLORS["a"])
+        self._rows[row] = (state, tile)
+        return tile
 
     def get_image_for_icon(self):
         """ """
         image, draw = self.double_icon(width=self.sizes[0], height=self.sizes[1])
 
-        if not self.mcdu.draw_text(
-            mcdu_unit=self.mcdu_unit,
-            draw=draw,
-            fonts=[self.fontsm, self.font, self.altfontsm, self.altfont],
-            left_offset=self.side_margin + self.xd,  # int(self.xd / 2),
-            char_delta=self.xd,
-            line_bases=self.linebases,
-            font_sizes=[self.font_lg, self.font_sm],
-        ):
+        # Lines are displayed as soon as they are received
+        self._ready = self.mcdu.readiness(self.mcdu_unit) > 0.0
+        if self._ready:
+            snapshot = self.mcdu.snapshot  # all rows from the same complete snapshot
+            for row in range(MCDU_ROWS):
+                image.alpha_composite(self.get_row_tile(row, snapshot), dest=(0, self.linebases[row] - self.font_lg))
+        else:
             draw.text(
                 (int(image.width / 2), self.inside + int(image.height / 4)),
                 text="WAITING FOR DATA",